@@ -1,6 +1,7 @@
 import os
 import json
 import logging
+import threading
 import uvicorn
 from pydantic import BaseModel
 from fastapi import FastAPI, status
@@ -34,23 +35,41 @@ async def get_secrets(sr: SecretRequest):
     acct_secrets = get_secret_from_path(ACCOUNTS_SECRETS_PATH, sr.key)
     return {"function secrets": func_secrets, "account secrets": acct_secrets}
 
-def get_secret_from_path(path, key: str):
-    try:
+# path -> ((mtime, size, inode), parsed secrets), so each file is parsed only when it changes
+_secrets_cache = {}
+_secrets_cache_lock = threading.Lock()
+
+
+def load_secrets(path) -> dict:
+    st = os.stat(path)
+    stamp = (st.st_mtime_ns, st.st_size, st.st_ino)
+    cached = _secrets_cache.get(path)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+
+    with _secrets_cache_lock:
         with open(path) as f:
             content = f.read()
-            if not content or content.strip() == "":
-                logger.warning(f"Secret file at {path} is empty")
-                return {}
-            
+        if not content or content.strip() == "":
+            logger.warning(f"Secret file at {path} is empty")
+            secrets = {}
+        else:
             secrets = json.loads(content)
-            if key != "":
-                if key in secrets:
-                    return {key: secrets[key]}
-                else:
-                    logger.warning(f"Key '{key}' not found in secrets at {path}")
-                    return {}
+        _secrets_cache[path] = (stamp, secrets)
+    return secrets
+
+
+def get_secret_from_path(path, key: str):
+    try:
+        secrets = load_secrets(path)
+        if key != "":
+            if key in secrets:
+                return {key: secrets[key]}
             else:
-                return secrets
+                logger.warning(f"Key '{key}' not found in secrets at {path}")
+                return {}
+        else:
+            return dict(secrets)
     except FileNotFoundError:
         logger.error(f"Secret file not found at {path}")
         return {}
@@ -1,5 +1,6 @@
 import os
 import random
+import contextlib
 import datetime
 import time
 import json
@@ -148,35 +149,29 @@ def create_file_with_specific_size(filename, size_in_bytes):
     - filename: Path to the file to be created.
     - size_in_bytes: Desired size of the file in bytes.
     """
-    if tracer is not None:
-        with tracer.start_as_current_span("create_file") as span:
+    # trace the file creation when BYOO traces are configured
+    span_context = (
+        tracer.start_as_current_span("create_file")
+        if tracer is not None
+        else contextlib.nullcontext()
+    )
+    with span_context as span:
+        # Calculate how many full blocks of 4096 bytes need to be written
+        full_blocks = size_in_bytes // 4096
+        remainder = size_in_bytes % 4096
+        if span is not None:
             span.set_attribute("file.name", filename)
             span.set_attribute("file.size_bytes", size_in_bytes)
-            
-            with open(filename, "wb") as file:
-                # Calculate how many full blocks of 4096 bytes need to be written
-                full_blocks = size_in_bytes // 4096
-                span.set_attribute("file.full_blocks", full_blocks)
-                
-                # Write full blocks
-                for _ in range(full_blocks):
-                    file.write(b"\0" * 4096)
-
-                # Write remaining bytes if size_in_bytes is not a multiple of 4096
-                remainder = size_in_bytes % 4096
-                if remainder > 0:
-                    span.set_attribute("file.remainder_bytes", remainder)
-                    file.write(b"\0" * remainder)
-    else:
+            span.set_attribute("file.full_blocks", full_blocks)
+            if remainder > 0:
+                span.set_attribute("file.remainder_bytes", remainder)
+
         with open(filename, "wb") as file:
-            # Calculate how many full blocks of 4096 bytes need to be written
-            full_blocks = size_in_bytes // 4096
             # Write full blocks
             for _ in range(full_blocks):
                 file.write(b"\0" * 4096)
 
             # Write remaining bytes if size_in_bytes is not a multiple of 4096
-            remainder = size_in_bytes % 4096
             if remainder > 0:
                 file.write(b"\0" * remainder)
 
@@ -0,0 +1,92 @@
+"""
+Benchmarks of nv_cloud_function_helpers, run from the helper_library directory:
+
+    python -m benchmarks run --output results/main.json python -m benchmarks run
+    --filter images --quick python -m benchmarks compare results/main.json
+    results/branch.json --threshold 0.1
+
+run exits with 1 when a benchmark fails or exceeds its budget (e.g. the import
+time), compare exits with 1 when a benchmark regressed by more than the
+threshold.
+"""
+
+import sys
+import argparse
+
+from .runner import run, save_results, format_seconds
+from .compare import compare, load_results, DEFAULT_THRESHOLD
+
+
+def _run(args) -> int:
+    results = run(args.filter, args.quick)
+    if args.output:
+        save_results(results, args.output)
+        print(f"Results written to {args.output}")
+    failed = [
+        name
+        for name, result in results["results"].items()
+        if "error" in result or result.get("over_budget")
+    ]
+    if failed:
+        print(f"Failed or over budget: {', '.join(failed)}")
+        return 1
+    return 0
+
+
+def _compare(args) -> int:
+    rows = compare(
+        load_results(args.baseline), load_results(args.current), args.threshold
+    )
+    regressions = sum(row[4] == "regression" for row in rows)
+    for name, base, new, ratio, status in rows:
+        if status in ("unchanged", "new", "removed") and not args.verbose:
+            continue
+        print(
+            f"{name:<60} "
+            f"{format_seconds(base) if base is not None else '-':>10} "
+            f"{format_seconds(new) if new is not None else '-':>10} "
+            f"{f'{ratio:.2f}x' if ratio is not None else '':>7} {status}"
+        )
+    compared = sum(row[3] is not None for row in rows)
+    print(
+        f"{regressions} regression(s) above {args.threshold:.0%} "
+        f"out of {compared} benchmarks in both results"
+    )
+    return 1 if regressions else 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks")
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+
+    run_parser = commands.add_parser("run", help="run the benchmarks")
+    run_parser.add_argument("--filter", help="regex on the benchmark names")
+    run_parser.add_argument("--output", help="path of the JSON results")
+    run_parser.add_argument(
+        "--quick", action="store_true", help="fewer, shorter samples"
+    )
+    run_parser.set_defaults(handler=_run)
+
+    compare_parser = commands.add_parser(
+        "compare", help="compare two JSON results"
+    )
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument(
+        "--threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help="relative slowdown reported as a regression (default %(default)s)",
+    )
+    compare_parser.add_argument(
+        "--verbose", action="store_true", help="also list unchanged benchmarks"
+    )
+    compare_parser.set_defaults(handler=_compare)
+
+    args = parser.parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
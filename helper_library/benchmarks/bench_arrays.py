@@ -0,0 +1,131 @@
+"""
+npz loading, the asset cache, the ndarray codec and the Triton micro-batching
+executor
+"""
+
+import os
+import json
+import tempfile
+
+import numpy as np
+
+from nv_cloud_function_helpers.nvcf_container import helpers, ndarray_codec
+from nv_cloud_function_helpers.nvcf_container.asset_cache import AssetCache
+from nv_cloud_function_helpers.nvcf_container.batching import (
+    BatchExecutor,
+    round_up_shape,
+)
+from .inputs import MB, b64_of_size
+from .runner import benchmark
+from .stand_ins import install_triton_stub, InferenceRequest, Tensor
+
+install_triton_stub()
+
+NPZ_MODES = ["read", "mmap", "cache"]
+
+
+def _npz_file(size: int) -> str:
+    directory = tempfile.mkdtemp(prefix="nvcf-bench-")
+    rng = np.random.default_rng(size)
+    np.savez(
+        os.path.join(directory, "embeddings.npz"),
+        embeddings=rng.random(size // 4, dtype=np.float32),
+        labels=np.arange(1000),
+    )
+    return directory
+
+
+@benchmark(params=NPZ_MODES)
+def load_npz_64mb(mode):
+    directory = _npz_file(64 * MB)
+    kwargs = {
+        "read": {},
+        "mmap": {"mmap_mode": "r"},
+        "cache": {"cache": True},
+    }[mode]
+    return lambda: helpers.load_npz(
+        "embeddings.npz", directory, "embeddings", **kwargs
+    )
+
+
+@benchmark()
+def asset_cache_image_hit():
+    cache = AssetCache(max_bytes=256 * MB)
+    encoded = b64_of_size(1 * MB)
+    cache.load_image(encoded, "/nonexistent")
+    return lambda: cache.load_image(encoded, "/nonexistent")
+
+
+@benchmark()
+def asset_cache_npz_hit():
+    cache = AssetCache(max_bytes=256 * MB)
+    directory = _npz_file(16 * MB)
+    cache.load_npz("embeddings.npz", directory, "embeddings")
+    return lambda: cache.load_npz("embeddings.npz", directory, "embeddings")
+
+
+@benchmark(params=[1, 8, 32])
+def batch_executor(n_requests):
+    rng = np.random.default_rng(0)
+    requests = [
+        InferenceRequest(
+            [
+                Tensor(
+                    "INPUT_IDS",
+                    rng.integers(
+                        0, 32000, (1, int(rng.integers(64, 128))), np.int32
+                    ),
+                )
+            ]
+        )
+        for _ in range(n_requests)
+    ]
+    embedding = rng.random((32000, 16), dtype=np.float32)
+    executor = BatchExecutor(
+        lambda ids: embedding[ids].sum(axis=1),
+        ["INPUT_IDS"],
+        ["EMBEDDING"],
+        max_batch_size=32,
+        bucket_shape=round_up_shape(64),
+    )
+    return lambda: executor.execute(requests)
+
+
+NDARRAY_VARIANTS = ["tolist_json", "raw", "zlib"]
+
+
+def _embeddings() -> np.ndarray:
+    # float16 embeddings, a common model output
+    rng = np.random.default_rng(0)
+    return rng.random((1024, 768), dtype=np.float32).astype(np.float16)
+
+
+@benchmark(params=NDARRAY_VARIANTS)
+def encode_ndarray_1024x768(variant):
+    array = _embeddings()
+    if variant == "tolist_json":
+        func = lambda: json.dumps(array.tolist())
+    else:
+        compression = None if variant == "raw" else variant
+        func = lambda: ndarray_codec.encode_ndarray(array, compression)
+    return func, {"encoded_bytes": len(func())}
+
+
+@benchmark(params=NDARRAY_VARIANTS)
+def decode_ndarray_1024x768(variant):
+    array = _embeddings()
+    if variant == "tolist_json":
+        encoded = json.dumps(array.tolist())
+        return lambda: np.array(json.loads(encoded), dtype=array.dtype)
+    compression = None if variant == "raw" else variant
+    encoded = ndarray_codec.encode_ndarray(array, compression)
+    return lambda: ndarray_codec.decode_ndarray(encoded)
+
+
+@benchmark()
+def ndarrays_round_trip_batch_of_64():
+    rng = np.random.default_rng(0)
+    arrays = [rng.random((16, 128), dtype=np.float32) for _ in range(64)]
+    return lambda: ndarray_codec.decode_ndarrays(
+        ndarray_codec.encode_ndarrays(arrays)
+    )
@@ -0,0 +1,110 @@
+"""
+base64 helpers, whole-buffer and streaming, with their peak memory
+"""
+
+import os
+import io
+import base64
+import tempfile
+
+import numpy as np
+
+from nv_cloud_function_helpers.nvcf_container import helpers
+from .inputs import KB, MB
+from .runner import benchmark, peak_memory
+
+SIZES = [64 * KB, 1 * MB, 16 * MB]
+
+
+def _random_bytes(size: int) -> bytes:
+    return (
+        np.random.default_rng(size).integers(0, 256, size, np.uint8).tobytes()
+    )
+
+
+@benchmark(params=SIZES)
+def encode_bytes(size):
+    data = _random_bytes(size)
+    func = lambda: helpers.encode_bytes_base64_to_str(data)
+    return func, {"peak_bytes": peak_memory(func)}
+
+
+@benchmark(params=SIZES)
+def encode_stream(size):
+    data = _random_bytes(size)
+
+    def func():
+        helpers.encode_base64_stream(io.BytesIO(data), io.BytesIO())
+
+    return func, {"peak_bytes": peak_memory(func)}
+
+
+@benchmark(params=SIZES)
+def decode_str(size):
+    encoded = base64.b64encode(_random_bytes(size)).decode("ascii")
+    func = lambda: helpers.decode_base64_str_to_bytes(encoded)
+    return func, {"peak_bytes": peak_memory(func)}
+
+
+@benchmark(params=SIZES)
+def decode_str_validated(size):
+    encoded = base64.b64encode(_random_bytes(size)).decode("ascii")
+    return lambda: helpers.decode_base64_str_to_bytes(encoded, validate=True)
+
+
+@benchmark(params=SIZES)
+def decode_stream(size):
+    encoded = base64.b64encode(_random_bytes(size))
+
+    def func():
+        helpers.decode_base64_stream(io.BytesIO(encoded), io.BytesIO())
+
+    return func, {"peak_bytes": peak_memory(func)}
+
+
+def _files(size: int, encoded: bool) -> tuple:
+    directory = tempfile.mkdtemp(prefix="nvcf-bench-")
+    source = os.path.join(directory, "source")
+    data = _random_bytes(size)
+    with open(source, "wb") as f:
+        f.write(base64.b64encode(data) if encoded else data)
+    return source, os.path.join(directory, "destination")
+
+
+def _file_benchmark(size: int, whole_buffer, stream) -> tuple:
+    """
+    Times stream(src, dst) between two files and reports its peak memory next to
+    the one of whole_buffer(data) -> bytes, which reads, converts and writes the
+    whole file
+    """
+    source, destination = _files(size, whole_buffer is base64.b64decode)
+
+    def baseline():
+        with open(source, "rb") as src, open(destination, "wb") as dst:
+            dst.write(whole_buffer(src.read()))
+
+    def func():
+        with open(source, "rb") as src, open(destination, "wb") as dst:
+            stream(src, dst)
+
+    peak, baseline_peak = peak_memory(func), peak_memory(baseline)
+    return func, {
+        "peak_bytes": peak,
+        "whole_buffer_peak_bytes": baseline_peak,
+        "peak_vs_whole_buffer": peak / baseline_peak,
+    }
+
+
+@benchmark(params=SIZES)
+def encode_file_stream(size):
+    return _file_benchmark(size, base64.b64encode, helpers.encode_base64_stream)
+
+
+@benchmark(params=SIZES)
+def decode_file_stream(size):
+    return _file_benchmark(size, base64.b64decode, helpers.decode_base64_stream)
+
+
+@benchmark()
+def base64_encoded_size():
+    return lambda: helpers.base64_encoded_size(123456789)
@@ -0,0 +1,117 @@
+"""
+Request headers, configuration, secrets and Triton scalar inputs
+"""
+
+import os
+import json
+import tempfile
+
+import numpy as np
+
+from nv_cloud_function_helpers.nvcf_container import helpers
+from .inputs import request_headers
+from .runner import benchmark
+from .stand_ins import install_triton_stub, InferenceRequest, Tensor
+
+install_triton_stub()
+
+
+def _read_all_getters(request_parameters):
+    return (
+        helpers.get_request_id(request_parameters),
+        helpers.get_nca_id(request_parameters),
+        helpers.get_function_id(request_parameters),
+        helpers.get_output_path(request_parameters),
+        helpers.get_input_path(request_parameters),
+        helpers.get_asset_ids(request_parameters),
+        helpers.get_max_msg_size(request_parameters),
+    )
+
+
+@benchmark()
+def getters_from_dict():
+    headers = request_headers()
+    return lambda: _read_all_getters(headers)
+
+
+@benchmark()
+def getters_from_request_context():
+    headers = request_headers()
+    return lambda: _read_all_getters(helpers.RequestContext(headers))
+
+
+@benchmark()
+def get_config_value():
+    model_config = {
+        "parameters": {
+            f"VALUE_{i}": {"string_value": str(i)} for i in range(20)
+        }
+    }
+    return lambda: [
+        helpers.get_config_value(f"VALUE_{i}", model_config) for i in range(20)
+    ]
+
+
+@benchmark()
+def config_resolver_access():
+    model_config = {
+        "parameters": {
+            "MAX_BATCH_SIZE": {"string_value": "8"},
+            "USE_FP16": {"string_value": "true"},
+            "TIMEOUT": {"string_value": "1500ms"},
+            "LABELS": {"string_value": "cat,dog,bird"},
+        }
+    }
+    config = helpers.ConfigResolver(
+        {
+            "MAX_BATCH_SIZE": helpers.ConfigOption(int, 1),
+            "USE_FP16": helpers.ConfigOption(bool, False),
+            "TIMEOUT": helpers.ConfigOption("duration", 30.0),
+            "LABELS": helpers.ConfigOption(list, []),
+        },
+        model_config,
+    )
+    return lambda: (
+        config.MAX_BATCH_SIZE,
+        config.USE_FP16,
+        config.TIMEOUT,
+        config.LABELS,
+    )
+
+
+@benchmark(params=[10, 1000])
+def secrets_lookup(n_secrets):
+    directory = tempfile.mkdtemp(prefix="nvcf-bench-")
+    path = os.path.join(directory, "secrets.json")
+    with open(path, "w") as f:
+        json.dump({f"SECRET_{i}": "x" * 64 for i in range(n_secrets)}, f)
+    store = helpers.get_secrets_store(path)
+    return lambda: store.get("SECRET_0")
+
+
+def _scalar_requests(n: int) -> list:
+    return [
+        InferenceRequest(
+            [
+                Tensor("prompt", np.array([b"a photo of a cat"], dtype=object)),
+                Tensor("steps", np.array([30], dtype=np.int32)),
+                Tensor("guidance", np.array([7.5], dtype=np.float32)),
+            ]
+        )
+        for _ in range(n)
+    ]
+
+
+PAIRS = [("prompt", ""), ("steps", 50), ("guidance", 7.5), ("seed", 0)]
+
+
+@benchmark(params=[1, 8, 64])
+def get_scalar_inputs(n_requests):
+    requests = _scalar_requests(n_requests)
+    return lambda: [helpers.get_scalar_inputs(r, PAIRS) for r in requests]
+
+
+@benchmark(params=[1, 8, 64])
+def get_batch_scalar_inputs(n_requests):
+    requests = _scalar_requests(n_requests)
+    return lambda: helpers.get_batch_scalar_inputs(requests, PAIRS)
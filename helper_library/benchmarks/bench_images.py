@@ -0,0 +1,104 @@
+"""
+Image decoding, encoding and saving
+"""
+
+import os
+import tempfile
+import itertools
+
+from nv_cloud_function_helpers.nvcf_container import helpers
+from .inputs import KB, MB, make_image, b64_of_size, encoded_image_of_size
+from .runner import benchmark
+
+LOAD_SIZES = [10 * KB, 100 * KB, 1 * MB, 5 * MB, 20 * MB]
+PROFILES = list(
+    itertools.product(
+        ("JPEG", "PNG", "WEBP"), sorted(helpers.ENCODING_PROFILES)
+    )
+)
+
+
+@benchmark(params=LOAD_SIZES)
+def load_image_b64(size):
+    encoded = b64_of_size(size)
+    return lambda: helpers.load_image(encoded, "/nonexistent"), {
+        "input_bytes": len(encoded)
+    }
+
+
+@benchmark(params=[100 * KB, 5 * MB])
+def load_image_path(size):
+    directory = tempfile.mkdtemp(prefix="nvcf-bench-")
+    with open(os.path.join(directory, "image.jpg"), "wb") as f:
+        f.write(encoded_image_of_size(size))
+    return lambda: helpers.load_image("image.jpg", directory)
+
+
+@benchmark(params=[None, (512, 512), (224, 224)])
+def decode_4k_jpeg(target_size):
+    encoded = helpers.encode_image_to_base64(make_image(3840, 2160), "JPEG", 90)
+    return lambda: helpers.decode_base64_to_image(
+        encoded, target_size=target_size
+    )
+
+
+@benchmark(params=PROFILES)
+def encode_1080p(format_profile):
+    image_format, profile = format_profile
+    image = make_image(1920, 1080)
+    func = lambda: helpers.encode_image_to_base64(
+        image, image_format, 90, profile
+    )
+    return func, {"output_bytes": len(func())}
+
+
+@benchmark(params=[1, 4, None])
+def encode_batch_of_16(max_workers):
+    images = [make_image(1024, 1024, seed=i) for i in range(16)]
+    return lambda: helpers.encode_images_to_base64(
+        images, "JPEG", 90, max_workers=max_workers
+    )
+
+
+@benchmark()
+def iter_image_base64_1080p():
+    image = make_image(1920, 1080)
+    return lambda: sum(
+        len(chunk) for chunk in helpers.iter_image_base64(image, "JPEG", 90)
+    )
+
+
+@benchmark()
+def save_image_with_directory():
+    directory = tempfile.mkdtemp(prefix="nvcf-bench-")
+    image = make_image(1024, 1024)
+    return lambda: helpers.save_image_with_directory(
+        image, os.path.join(directory, "out"), "JPEG"
+    )
+
+
+@benchmark(params=[1, 4])
+def image_writer_16_images(max_workers):
+    directory = tempfile.mkdtemp(prefix="nvcf-bench-")
+    images = [make_image(1024, 1024, seed=i) for i in range(16)]
+    writer = helpers.ImageWriter(max_workers=max_workers)
+
+    def func():
+        for i, image in enumerate(images):
+            writer.save(image, os.path.join(directory, str(i)), "JPEG")
+        writer.flush()
+
+    return func
+
+
+@benchmark(params=["inline", "large_output"])
+def route_image_response(route):
+    directory = tempfile.mkdtemp(prefix="nvcf-bench-")
+    request_parameters = {
+        "NVCF-LARGE-OUTPUT-DIR": directory,
+        "NVCF-MAX-RESPONSE-SIZE-BYTES": str(
+            5 * 1000 * 1000 if route == "inline" else 1000
+        ),
+    }
+    image = make_image(1024, 1024)
+    return lambda: helpers.route_image_response(request_parameters, image)
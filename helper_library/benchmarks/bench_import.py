@@ -0,0 +1,60 @@
+"""
+Cold import time of the helpers, the light path must not load the heavy
+dependencies
+"""
+
+import os
+import sys
+import subprocess
+
+from .runner import benchmark
+
+MODULE = "nv_cloud_function_helpers.nvcf_container.helpers"
+HEAVY_MODULES = (
+    "numpy",
+    "PIL",
+    "requests",
+    "urllib3",
+    "asyncio",
+    "opentelemetry",
+)
+IMPORT_TIME_BUDGET_S = (
+    float(os.environ.get("NVCF_IMPORT_TIME_BUDGET_MS", "150")) / 1000
+)
+
+# prints the modules that were loaded, -X importtime writes the timings to
+# stderr
+_IMPORT_SCRIPT = f"""
+import sys
+import {MODULE}
+print(",".join(m for m in {HEAVY_MODULES!r} if m in sys.modules))
+"""
+
+
+def _import_seconds(stderr: str) -> float:
+    """
+    Cumulative import time of MODULE in a -X importtime report
+    """
+    for line in stderr.splitlines():
+        if line.rstrip().endswith(f"| {MODULE}"):
+            return int(line.split("|")[1]) / 1e6
+    raise ValueError(f"{MODULE} not found in the -X importtime report")
+
+
+@benchmark(budget_s=IMPORT_TIME_BUDGET_S, external=True)
+def import_helpers():
+    samples = []
+    for _ in range(7):
+        process = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", _IMPORT_SCRIPT],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            check=True,
+            universal_newlines=True,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        )
+        loaded = process.stdout.strip()
+        if loaded:
+            raise AssertionError(f"importing {MODULE} loaded {loaded}")
+        samples.append(_import_seconds(process.stderr))
+    return {"samples": samples}
@@ -0,0 +1,132 @@
+"""
+Progress reporting, large output routing and compression, and logging
+"""
+
+import os
+import io
+import sys
+import gzip
+import json
+import tempfile
+import subprocess
+
+from nv_cloud_function_helpers.nvcf_container import compression, helpers
+from .inputs import KB, MB, text_of_size
+from .runner import benchmark
+
+# logs from threads of a subprocess whose stdout is discarded, and prints the
+# elapsed time
+_LOGGING_SCRIPT = """
+import sys, time, json, threading
+from nv_cloud_function_helpers.nvcf_container.helpers import (
+    get_logger,
+    set_log_request_id,
+)
+logger = get_logger(json_format={json_format})
+n_threads, n_records = {n_threads}, {n_records}
+def work(i):
+    set_log_request_id({{"NVCF-REQID": "request-%d" % i}})
+    for j in range(n_records):
+        logger.info("step %d of request %d", j, i)
+threads = [threading.Thread(target=work, args=(i,)) for i in range(n_threads)]
+start = time.perf_counter()
+for t in threads: t.start()
+for t in threads: t.join()
+elapsed = time.perf_counter() - start
+print(json.dumps(elapsed / (n_threads * n_records)), file=sys.stderr)
+"""
+
+
+def _request_parameters(directory: str, max_msg_size: int) -> dict:
+    return {
+        "NVCF-REQID": "5f2d3c1e-8b7a-4c2d-9e1f-0a1b2c3d4e5f",
+        "NVCF-LARGE-OUTPUT-DIR": directory,
+        "NVCF-MAX-RESPONSE-SIZE-BYTES": str(max_msg_size),
+    }
+
+
+@benchmark()
+def update_progress_file():
+    parameters = _request_parameters(tempfile.mkdtemp(prefix="nvcf-bench-"), 0)
+    partial = {"step": 10, "preview": "x" * 1024}
+    return lambda: helpers.update_progress_file(parameters, 50, partial)
+
+
+@benchmark()
+def progress_reporter_update():
+    parameters = _request_parameters(tempfile.mkdtemp(prefix="nvcf-bench-"), 0)
+    reporter = helpers.ProgressReporter(parameters)
+    partial = {"step": 10, "preview": "x" * 1024}
+    return lambda: reporter.update(50, partial)
+
+
+@benchmark(params=[64 * KB, 16 * MB])
+def route_response(size):
+    parameters = _request_parameters(
+        tempfile.mkdtemp(prefix="nvcf-bench-"), 5 * 1000 * 1000
+    )
+    payload = os.urandom(size)
+    return lambda: helpers.route_response(parameters, payload, "output.bin")
+
+
+# gzip module (one thread) against the block compression on 1 and on all the
+# threads
+COMPRESSORS = ["gzip_module", 1]
+if compression.GZIP_WORKERS > 1:
+    COMPRESSORS.append(compression.GZIP_WORKERS)
+
+
+def _compress(data: bytes, compressor):
+    if compressor == "gzip_module":
+        return lambda: gzip.compress(data, compression.GZIP_LEVEL)
+    return lambda: compression.gzip_compress_stream(
+        data, io.BytesIO(), max_workers=compressor
+    )
+
+
+@benchmark(params=COMPRESSORS)
+def gzip_text_32mb(compressor):
+    data = text_of_size(32 * MB)
+    func = _compress(data, compressor)
+    if compressor == "gzip_module":
+        return func, {"ratio": len(func()) / len(data)}
+    return func, {"ratio": func()["ratio"]}
+
+
+@benchmark(params=COMPRESSORS)
+def gzip_incompressible_32mb(compressor):
+    # e.g. videos or encoded images, the block compression stores them after the
+    # first blocks
+    return _compress(os.urandom(32 * MB), compressor)
+
+
+@benchmark()
+def gzip_compress_directory():
+    directory = tempfile.mkdtemp(prefix="nvcf-bench-")
+    for i in range(4):
+        with open(os.path.join(directory, f"result_{i}.jsonl"), "wb") as f:
+            f.write(text_of_size(4 * MB))
+    # keeps the originals, the .gz files of the previous call are overwritten
+    return lambda: compression.gzip_compress_directory(
+        directory, remove_original=False
+    )
+
+
+@benchmark(params=[(1, "text"), (8, "text"), (8, "json")], external=True)
+def logger_contention(threads_format):
+    n_threads, log_format = threads_format
+    script = _LOGGING_SCRIPT.format(
+        json_format=log_format == "json", n_threads=n_threads, n_records=5000
+    )
+    samples = []
+    for _ in range(3):
+        process = subprocess.run(
+            [sys.executable, "-c", script],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            check=True,
+            universal_newlines=True,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        )
+        samples.append(json.loads(process.stderr.strip().splitlines()[-1]))
+    return {"samples": samples}
@@ -0,0 +1,42 @@
+"""
+Overhead of the OpenTelemetry instrumentation while it is disabled (the default)
+"""
+
+from nv_cloud_function_helpers.nvcf_container import helpers, telemetry
+from .inputs import make_image
+from .runner import benchmark
+
+
+def _work(x):
+    return x
+
+
+_instrumented_work = telemetry.instrument("work")(_work)
+
+
+@benchmark(params=["plain", "instrumented"])
+def disabled_call(variant):
+    telemetry.disable_telemetry()
+    func = _work if variant == "plain" else _instrumented_work
+    return lambda: func(1)
+
+
+@benchmark()
+def disabled_span():
+    telemetry.disable_telemetry()
+
+    def func():
+        with telemetry.span("work") as s:
+            s.add_bytes(1)
+
+    return func
+
+
+@benchmark(params=["plain", "instrumented"])
+def disabled_encode_64px(variant):
+    telemetry.disable_telemetry()
+    image = make_image(64, 64)
+    encode = helpers._save_image_to_buffer
+    if variant == "plain":
+        encode = encode.__wrapped__
+    return lambda: encode(image, "JPEG", 90)
@@ -0,0 +1,111 @@
+"""
+Uploads to a local object store stand-in, measuring the client side overhead
+over loopback
+"""
+
+import os
+import asyncio
+import tempfile
+import threading
+import importlib.util
+
+import requests
+
+from nv_cloud_function_helpers.nvcf_container import helpers
+from .inputs import KB, MB
+from .runner import benchmark
+from .stand_ins import object_store_url
+
+SIZES = [64 * KB, 1 * MB, 16 * MB]
+HEADERS = {"Content-Type": "application/octet-stream"}
+
+
+def _payload(size: int) -> bytes:
+    return os.urandom(size)
+
+
+@benchmark(params=SIZES)
+def upload_bytes(size):
+    url = object_store_url()
+    data = _payload(size)
+    return lambda: helpers.upload(data, url, HEADERS)
+
+
+@benchmark(params=SIZES)
+def upload_file(size):
+    url = object_store_url()
+    directory = tempfile.mkdtemp(prefix="nvcf-bench-")
+    path = os.path.join(directory, "payload.bin")
+    with open(path, "wb") as f:
+        f.write(_payload(size))
+    return lambda: helpers.upload_file(path, url, HEADERS)
+
+
+@benchmark()
+def upload_pipe():
+    # a stream of unknown length is sent chunked, the stand-in must receive all
+    # of it
+    url = object_store_url()
+    data = _payload(1 * MB)
+
+    def func():
+        read_fd, write_fd = os.pipe()
+        writer = threading.Thread(target=_write_pipe, args=(write_fd, data))
+        writer.start()
+        with os.fdopen(read_fd, "rb") as stream:
+            response = helpers.upload(stream, url, HEADERS)
+        writer.join()
+        if response["response"] != str(len(data)):
+            raise AssertionError(
+                f"the stand-in received {response['response']} "
+                f"of {len(data)} bytes"
+            )
+
+    return func
+
+
+def _write_pipe(fd: int, data: bytes):
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+
+
+@benchmark(params=["pooled_session", "new_connection"])
+def small_upload_latency(connection):
+    url = object_store_url()
+    data = _payload(4 * KB)
+    if connection == "pooled_session":
+        return lambda: helpers.upload(data, url, HEADERS)
+    # what every upload did before the shared session: a new connection each
+    # time
+    return lambda: requests.put(url, data=data, headers=HEADERS, timeout=30)
+
+
+@benchmark(params=[1, 4])
+def upload_file_multipart_64mb(max_workers):
+    directory = tempfile.mkdtemp(prefix="nvcf-bench-")
+    path = os.path.join(directory, "payload.bin")
+    with open(path, "wb") as f:
+        f.write(_payload(64 * MB))
+    part_urls = [
+        object_store_url(f"/object?partNumber={i}") for i in range(1, 9)
+    ]
+    return lambda: helpers.upload_file_multipart(
+        path, part_urls, HEADERS, part_size=8 * MB, max_workers=max_workers
+    )
+
+
+if importlib.util.find_spec("httpx") is not None:
+
+    @benchmark(params=[1, 8])
+    def gather_16_uploads(max_concurrency):
+        url = object_store_url()
+        data = _payload(256 * KB)
+
+        async def uploads():
+            return await helpers.gather_uploads(
+                (helpers.aupload(data, url, HEADERS) for _ in range(16)),
+                max_concurrency,
+            )
+
+        loop = asyncio.new_event_loop()
+        return lambda: loop.run_until_complete(uploads())
@@ -0,0 +1,53 @@
+import json
+
+DEFAULT_THRESHOLD = (
+    0.10  # relative change of the median reported as a regression
+)
+
+
+def load_results(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(
+    baseline: dict, current: dict, threshold: float = DEFAULT_THRESHOLD
+) -> list:
+    """
+    Compares the median times of two result files
+    :param baseline: results of the reference commit, see runner.save_results
+    :param current: results of the commit under test
+    :param threshold: relative slowdown above which a benchmark is a regression,
+        e.g. 0.1 for 10%
+    :return: list of (name, baseline median, current median, ratio, status)
+        sorted by name, status is "regression", "improvement", "unchanged",
+        "new", "removed" or "error"
+    """
+    base_results = baseline["results"]
+    new_results = current["results"]
+    rows = []
+    for name in sorted(set(base_results) | set(new_results)):
+        base = base_results.get(name)
+        new = new_results.get(name)
+        if base is None:
+            rows.append((name, None, _median(new), None, "new"))
+            continue
+        if new is None:
+            rows.append((name, _median(base), None, None, "removed"))
+            continue
+        if "error" in new or "error" in base:
+            rows.append((name, _median(base), _median(new), None, "error"))
+            continue
+        ratio = new["median_s"] / base["median_s"] if base["median_s"] else 1.0
+        if ratio > 1 + threshold:
+            status = "regression"
+        elif ratio < 1 / (1 + threshold):
+            status = "improvement"
+        else:
+            status = "unchanged"
+        rows.append((name, base["median_s"], new["median_s"], ratio, status))
+    return rows
+
+
+def _median(result: dict):
+    return None if result is None else result.get("median_s")
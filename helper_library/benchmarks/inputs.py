@@ -0,0 +1,110 @@
+"""
+Deterministic, realistic benchmark inputs
+"""
+
+import io
+import base64
+import functools
+
+import numpy as np
+from PIL import Image
+
+KB = 1024
+MB = 1024 * 1024
+
+
+def request_headers(max_msg_size: int = 5 * 1000 * 1000) -> dict:
+    """
+    Invocation headers as an HTTP framework passes them to a function: lowercase
+    keys
+    """
+    return {
+        "nvcf-reqid": "5f2d3c1e-8b7a-4c2d-9e1f-0a1b2c3d4e5f",
+        "nvcf-ncaid": "nca-0123456789",
+        "nvcf-function-id": "fd3c1e2b-7a6d-4c5b-8e9f-1a2b3c4d5e6f",
+        "nvcf-function-name": "benchmark-function",
+        "nvcf-properties-sub": "benchmark-user",
+        "nvcf-asset-dir": "/var/inf/inputAssets/5f2d3c1e",
+        "nvcf-large-output-dir": "/var/inf/response/5f2d3c1e",
+        "nvcf-function-asset-ids": "a1b2c3d4,e5f6a7b8,c9d0e1f2",
+        "nvcf-max-response-size-bytes": str(max_msg_size),
+        "content-type": "application/json",
+        "accept": "application/json",
+        "user-agent": "python-requests/2.31.0",
+    }
+
+
+@functools.lru_cache(maxsize=None)
+def _photo_like(width: int, height: int, seed: int) -> bytes:
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    r = 127 + 100 * np.sin(x / 97.0) * np.cos(y / 61.0)
+    g = 127 + 100 * np.sin((x + y) / 143.0)
+    b = 127 + 100 * np.cos(x / 53.0 - y / 89.0)
+    pixels = np.stack([r, g, b], axis=-1)
+    pixels += rng.normal(0, 12, pixels.shape)  # sensor noise
+    return np.clip(pixels, 0, 255).astype(np.uint8).tobytes()
+
+
+def make_image(width: int, height: int, mode: str = "RGB", seed: int = 0):
+    """
+    A smooth gradient with noise, compresses roughly like a photo
+    :return: a PIL Image
+    """
+    image = Image.frombytes(
+        "RGB", (width, height), _photo_like(width, height, seed)
+    )
+    return image if mode == "RGB" else image.convert(mode)
+
+
+def encode_image(image, image_format: str = "JPEG", quality: int = 90) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, image_format, quality=quality)
+    return buffer.getvalue()
+
+
+@functools.lru_cache(maxsize=None)
+def encoded_image_of_size(
+    target_bytes: int, image_format: str = "JPEG"
+) -> bytes:
+    """
+    An encoded image of roughly target_bytes, the dimensions are scaled from a
+    sample's bytes per pixel
+    """
+    sample = encode_image(make_image(256, 256), image_format)
+    pixels = target_bytes * 256 * 256 / len(sample)
+    for _ in range(3):
+        side = max(16, int(pixels**0.5))
+        width, height = side * 4 // 3, side * 3 // 4
+        data = encode_image(make_image(width, height), image_format)
+        if abs(len(data) - target_bytes) < 0.1 * target_bytes:
+            break
+        pixels *= target_bytes / len(data)
+    return data
+
+
+def b64_of_size(target_bytes: int, image_format: str = "JPEG") -> str:
+    """
+    A base64 encoded image whose base64 string is roughly target_bytes long
+    """
+    data = encoded_image_of_size(target_bytes * 3 // 4, image_format)
+    return base64.b64encode(data).decode("ascii")
+
+
+@functools.lru_cache(maxsize=None)
+def text_of_size(target_bytes: int) -> bytes:
+    """
+    JSON lines of model results, compresses roughly like logs or ASCII meshes
+    """
+    rng = np.random.default_rng(target_bytes)
+    lines = []
+    size = 0
+    while size < target_bytes:
+        line = (
+            f'{{"id": {len(lines)}, "label": "class_{rng.integers(1000)}", '
+            f'"score": {rng.random():.6f}, '
+            f'"box": {rng.integers(0, 1024, 4).tolist()}}}\n'
+        )
+        lines.append(line)
+        size += len(line)
+    return "".join(lines).encode("ascii")[:target_bytes]
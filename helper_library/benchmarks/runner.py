@@ -0,0 +1,217 @@
+import os
+import re
+import sys
+import json
+import time
+import timeit
+import pkgutil
+import platform
+import importlib
+import statistics
+import subprocess
+import tracemalloc
+from collections import OrderedDict, namedtuple
+
+DEFAULT_MIN_TIME = 0.2  # seconds per sample
+QUICK_MIN_TIME = 0.02
+DEFAULT_REPEAT = 5
+QUICK_REPEAT = 3
+
+Benchmark = namedtuple(
+    "Benchmark", ["name", "func", "params", "budget_s", "external"]
+)
+
+BENCHMARKS = OrderedDict()
+
+
+def benchmark(params: list = None, budget_s: float = None, external=False):
+    """
+    Registers a benchmark, asv style: the decorated function does the setup and
+    returns the callable to time, optionally with a dict of extra metrics as a
+    (callable, extra) tuple.
+    With params, the function is called once per parameter and each result is
+    named name[param].
+    :param params: optional list of parameters, e.g. input sizes
+    :param budget_s: optional maximum median time per call, the run fails when
+        it is exceeded
+    :param external: the function measures itself and returns {"samples":
+        [seconds, ...], "extra": {...}}, for measurements done in a subprocess
+    """
+
+    def register(func):
+        name = f"{func.__module__.rsplit('.', 1)[-1]}.{func.__name__}"
+        BENCHMARKS[name] = Benchmark(name, func, params, budget_s, external)
+        return func
+
+    return register
+
+
+def peak_memory(func) -> int:
+    """
+    Peak memory in bytes allocated by one call of func, measured with
+    tracemalloc
+    """
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def load_benchmarks():
+    """
+    Imports every bench_* module of this package so their benchmarks are
+    registered
+    """
+    package = sys.modules[__package__]
+    for module in pkgutil.iter_modules(package.__path__):
+        if module.name.startswith("bench_"):
+            importlib.import_module(f"{__package__}.{module.name}")
+
+
+def _format_param(param) -> str:
+    if isinstance(param, (tuple, list)):
+        return ",".join(_format_param(p) for p in param)
+    if isinstance(param, int) and param >= 1024 and param % 1024 == 0:
+        for unit in ("KB", "MB", "GB"):
+            param //= 1024
+            if param < 1024 or param % 1024:
+                return f"{param}{unit}"
+    return str(param)
+
+
+def _time_callable(func, min_time: float, repeat: int) -> tuple:
+    """
+    Calls func in loops of at least min_time seconds
+    :return: (list of seconds per call, number of calls per loop)
+    """
+    timer = timeit.Timer(func)
+    number = 1
+    while True:
+        elapsed = timer.timeit(number)
+        if elapsed >= min_time or number >= 1 << 20:
+            break
+        # aim slightly above min_time to avoid another round
+        number = max(
+            number * 2, int(number * min_time * 1.2 / max(elapsed, 1e-9))
+        )
+    samples = [elapsed / number]
+    samples += [t / number for t in timer.repeat(repeat - 1, number)]
+    return samples, number
+
+
+def _summarize(samples: list) -> dict:
+    return {
+        "median_s": statistics.median(samples),
+        "min_s": min(samples),
+        "mean_s": statistics.mean(samples),
+        "stdev_s": statistics.stdev(samples) if len(samples) > 1 else 0.0,
+        "samples": len(samples),
+    }
+
+
+def run_benchmark(
+    bench: Benchmark, param, min_time: float, repeat: int
+) -> dict:
+    args = () if bench.params is None else (param,)
+    if bench.external:
+        measured = bench.func(*args)
+        result = _summarize(measured["samples"])
+        extra = measured.get("extra", {})
+    else:
+        target = bench.func(*args)
+        extra = {}
+        if isinstance(target, tuple):
+            target, extra = target
+        samples, number = _time_callable(target, min_time, repeat)
+        result = _summarize(samples)
+        result["number"] = number
+    if bench.budget_s is not None:
+        result["budget_s"] = bench.budget_s
+        result["over_budget"] = result["median_s"] > bench.budget_s
+    if extra:
+        result["extra"] = extra
+    return result
+
+
+def run(pattern: str = None, quick: bool = False, log=print) -> dict:
+    """
+    Runs the registered benchmarks
+    :param pattern: optional regex, only benchmarks whose full name matches are
+        run
+    :param quick: shorter and fewer samples, for smoke runs
+    :param log: function called with one progress line per benchmark
+    :return: results dict, see save_results
+    """
+    load_benchmarks()
+    min_time = QUICK_MIN_TIME if quick else DEFAULT_MIN_TIME
+    repeat = QUICK_REPEAT if quick else DEFAULT_REPEAT
+    regex = re.compile(pattern) if pattern else None
+
+    results = OrderedDict()
+    for bench in BENCHMARKS.values():
+        for param in bench.params or [None]:
+            name = bench.name
+            if bench.params is not None:
+                name = f"{name}[{_format_param(param)}]"
+            if regex is not None and not regex.search(name):
+                continue
+            try:
+                result = run_benchmark(bench, param, min_time, repeat)
+            except Exception as e:
+                result = {"error": f"{type(e).__name__}: {e}"}
+                log(f"{name:<60} ERROR {result['error']}")
+            else:
+                log(
+                    f"{name:<60} {format_seconds(result['median_s']):>10}"
+                    + (" OVER BUDGET" if result.get("over_budget") else "")
+                )
+            results[name] = result
+
+    return {"meta": _metadata(quick), "results": results}
+
+
+def format_seconds(seconds: float) -> str:
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.3g} {unit}"
+    return f"{seconds / 1e-9:.3g} ns"
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            check=True,
+            universal_newlines=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def _metadata(quick: bool) -> dict:
+    return {
+        "commit": _git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "quick": quick,
+    }
+
+
+def save_results(results: dict, path: str):
+    """
+    Writes the results as JSON: {"meta": {...}, "results": {name: {"median_s":
+    ..., ...}}}
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
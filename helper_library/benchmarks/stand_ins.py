@@ -0,0 +1,124 @@
+"""
+Offline stand-ins for the services the helpers talk to in production
+"""
+
+import sys
+import types
+import threading
+import http.server
+
+_server = None
+_server_lock = threading.Lock()
+
+
+class _ObjectStoreHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Accepts PUTs like a presigned object store URL, discards the body and
+    answers with the number of bytes received
+    """
+
+    protocol_version = "HTTP/1.1"  # keep-alive, like S3
+
+    def _read(self, n: int) -> int:
+        remaining = n
+        while remaining:
+            chunk = self.rfile.read(min(remaining, 1024 * 1024))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+        return n - remaining
+
+    def do_PUT(self):
+        received = 0
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            while True:
+                size = int(self.rfile.readline().split(b";")[0], 16)
+                received += self._read(size)
+                self.rfile.readline()  # CRLF after the chunk
+                if not size:
+                    break
+        else:
+            received = self._read(int(self.headers.get("Content-Length", 0)))
+        # headers and body in a single send, otherwise Nagle's algorithm and
+        # delayed ACKs add ~40ms to every request on loopback
+        body = b"%d" % received
+        self.wfile.write(
+            b"HTTP/1.1 200 OK\r\n"
+            b'ETag: "stand-in"\r\n'
+            b"Content-Length: %d\r\n\r\n%s" % (len(body), body)
+        )
+
+    def log_message(self, format, *args):
+        pass
+
+
+def object_store_url(path: str = "/object") -> str:
+    """
+    Starts the local object store stand-in on first use
+    :return: URL of path on the stand-in
+    """
+    global _server
+
+    with _server_lock:
+        if _server is None:
+            _server = http.server.ThreadingHTTPServer(
+                ("127.0.0.1", 0), _ObjectStoreHandler
+            )
+            _server.daemon_threads = True
+            threading.Thread(
+                target=_server.serve_forever, name="object-store", daemon=True
+            ).start()
+    host, port = _server.server_address
+    return f"http://{host}:{port}{path}"
+
+
+class Tensor:
+    def __init__(self, name: str, array):
+        self._name = name
+        self._array = array
+
+    def name(self) -> str:
+        return self._name
+
+    def as_numpy(self):
+        return self._array
+
+
+class InferenceRequest:
+    def __init__(self, tensors: list):
+        self.tensors = {t.name(): t for t in tensors}
+
+
+class InferenceResponse:
+    def __init__(self, output_tensors=None, error=None):
+        self.output_tensors = output_tensors
+        self.error = error
+
+
+class TritonError:
+    def __init__(self, message: str):
+        self.message = message
+
+
+def get_input_tensor_by_name(request: InferenceRequest, name: str):
+    return request.tensors.get(name)
+
+
+def install_triton_stub():
+    """
+    Registers this module's minimal triton_python_backend_utils API, replacing
+    the real module so that the benchmarks build requests the same way
+    everywhere
+    :return: the triton_python_backend_utils module
+    """
+    stub = types.ModuleType("triton_python_backend_utils")
+    for name in (
+        "Tensor",
+        "InferenceRequest",
+        "InferenceResponse",
+        "TritonError",
+        "get_input_tensor_by_name",
+    ):
+        setattr(stub, name, globals()[name])
+    sys.modules["triton_python_backend_utils"] = stub
+    return stub
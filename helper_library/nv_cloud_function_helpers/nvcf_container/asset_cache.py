@@ -0,0 +1,354 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+from PIL import Image
+
+from .helpers import load_image, load_npz, _classify_image_input
+
+DEFAULT_ASSET_CACHE_BYTES = 1024 * 1024 * 1024  # 1GB
+ASSET_CACHE_BYTES_ENV = "NVCF_ASSET_CACHE_BYTES"
+ASSET_CACHE_DIR_ENV = "NVCF_ASSET_CACHE_DIR"
+
+
+def content_hash(data) -> str:
+    """
+    Hashes an inline asset, e.g. a b64 string
+    :param data: str or bytes-like object
+    :return: hex digest
+    """
+    if isinstance(data, str):
+        data = data.encode("utf-8", "surrogatepass")
+    return hashlib.blake2b(data, digest_size=20).hexdigest()
+
+
+def file_stamp(path: str) -> tuple:
+    """
+    Identifies the version of a file from a single os.stat, without reading it
+    :param path: path of the file
+    :return: (st_mtime_ns, st_size, st_ino)
+    """
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+
+def _value_nbytes(value) -> int:
+    """
+    Approximate memory held by a decoded asset
+    """
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, Image.Image):
+        return value.width * value.height * len(value.getbands())
+    raise TypeError(
+        f"Unexpected asset type {type(value)}, "
+        "expected a PIL Image or a numpy array"
+    )
+
+
+class AssetCache:
+    """
+    In-process cache of decoded input assets (PIL Images and numpy arrays)
+    shared across requests.
+    Entries are keyed by asset ID, content hash (inline assets) or file stamp
+    (files) and decoding options, and evicted least recently used once max_bytes
+    is exceeded. With a disk_dir, evicted entries are spilled as raw .npy files
+    and read back without decoding again, up to disk_max_bytes.
+
+    Cached values are shared between requests: numpy arrays are read-only and
+    images must not be modified in place (call .copy() first).
+
+    Example Usage:
+        cache = get_asset_cache()
+        image = cache.load_image(
+            input_str, get_input_path(request_parameters), asset_id=asset_id
+        )
+        print(cache.stats())
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = DEFAULT_ASSET_CACHE_BYTES,
+        disk_dir: str = None,
+        disk_max_bytes: int = None,
+    ):
+        """
+        :param max_bytes: maximum approximate size of the decoded assets kept in
+            memory
+        :param disk_dir: optional directory of the on-disk second tier
+        :param disk_max_bytes: maximum size of the on-disk tier, defaults to 4 *
+            max_bytes
+        """
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = (
+            4 * max_bytes if disk_max_bytes is None else disk_max_bytes
+        )
+        self._entries = OrderedDict()  # key -> (value, nbytes)
+        self._disk_entries = OrderedDict()  # key -> (path, mode, nbytes)
+        self._bytes = 0
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._disk_hits = 0
+        if disk_dir is not None:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        """
+        :return: dict of hit/miss/eviction counters and the current memory and
+            disk usage
+        """
+        with self._lock:
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "disk_hits": self._disk_hits,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "disk_entries": len(self._disk_entries),
+                "disk_bytes": self._disk_bytes,
+            }
+
+    def clear(self):
+        """
+        Drops every entry from memory and disk
+        """
+        with self._lock:
+            disk_entries = list(self._disk_entries.values())
+            self._entries.clear()
+            self._disk_entries.clear()
+            self._bytes = 0
+            self._disk_bytes = 0
+        for path, _, _ in disk_entries:
+            _remove_quietly(path)
+
+    def get(self, key):
+        """
+        Gets a cached asset
+        :param key: a hashable key, e.g. (asset_id, content_hash)
+        :return: the cached value or None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return entry[0]
+            disk_entry = self._disk_entries.pop(key, None)
+            if disk_entry is None:
+                self._misses += 1
+                return None
+            self._disk_bytes -= disk_entry[2]
+
+        path, mode, _ = disk_entry
+        try:
+            value = _read_spilled(path, mode)
+        except OSError:
+            with self._lock:
+                self._misses += 1
+            return None
+        finally:
+            _remove_quietly(path)
+        with self._lock:
+            self._disk_hits += 1
+        self.put(key, value)
+        return value
+
+    def put(self, key, value):
+        """
+        Adds a decoded asset, evicting the least recently used ones if the cache
+        is full.
+        Assets larger than max_bytes are not cached.
+        :param key: a hashable key, e.g. (asset_id, content_hash)
+        :param value: a PIL Image or a numpy array
+        """
+        nbytes = _value_nbytes(value)
+        if nbytes > self.max_bytes:
+            return
+        if isinstance(value, np.ndarray):
+            value.flags.writeable = False
+
+        evicted = []
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            self._entries[key] = (value, nbytes)
+            self._bytes += nbytes
+            while self._bytes > self.max_bytes:
+                old_key, (old_value, old_nbytes) = self._entries.popitem(
+                    last=False
+                )
+                self._bytes -= old_nbytes
+                self._evictions += 1
+                evicted.append((old_key, old_value, old_nbytes))
+
+        if self.disk_dir is not None:
+            for old_key, old_value, old_nbytes in evicted:
+                self._spill(old_key, old_value, old_nbytes)
+
+    def get_or_load(self, key, loader):
+        """
+        Gets a cached asset or calls loader() and caches its result
+        :param key: a hashable key, e.g. (asset_id, content_hash)
+        :param loader: a function without arguments returning a PIL Image or a
+            numpy array
+        :return: the decoded asset
+        """
+        value = self.get(key)
+        if value is None:
+            value = loader()
+            self.put(key, value)
+        return value
+
+    def load_image(
+        self,
+        input_str: str,
+        root_dir: str,
+        asset_id: str = None,
+        has_transparency: bool = False,
+        target_size: tuple = None,
+        max_side: int = None,
+    ):
+        """
+        Cached load_image: the b64 string is hashed, a file is identified by its
+        mtime, size and inode, and the image is only decoded if this asset ID
+        and content were not decoded with the same options before
+        :param asset_id: the NVCF asset ID, defaults to the input path or
+            "inline"
+        :return: a PIL Image, shared with other requests
+        """
+        kind, value = _classify_image_input(input_str, root_dir)
+        if kind == "path":
+            version = file_stamp(value)
+        else:
+            version = content_hash(value)
+        if asset_id is None:
+            asset_id = input_str if kind == "path" else "inline"
+        key = (
+            asset_id,
+            version,
+            "image",
+            has_transparency,
+            None if target_size is None else tuple(target_size),
+            max_side,
+        )
+        return self.get_or_load(
+            key,
+            lambda: load_image(
+                input_str, root_dir, has_transparency, target_size, max_side
+            ),
+        )
+
+    def load_npz(
+        self,
+        input_str: str,
+        root_dir: str,
+        array_name: str = None,
+        asset_id: str = None,
+    ):
+        """
+        Cached load_npz: the file is identified by its mtime, size and inode,
+        like load_npz(cache=True), and the array is only read if this asset ID
+        and file version were not loaded before
+        :param asset_id: the NVCF asset ID, defaults to the input path
+        :return: a read-only numpy array, shared with other requests
+        """
+        path = os.path.join(root_dir, input_str)
+        try:
+            stamp = file_stamp(path)
+        except FileNotFoundError:
+            raise Exception(f"Unsure what {input_str} is!")
+        key = (
+            input_str if asset_id is None else asset_id,
+            stamp,
+            "npz",
+            array_name,
+        )
+        return self.get_or_load(
+            key, lambda: load_npz(input_str, root_dir, array_name)
+        )
+
+    def _spill(self, key, value, nbytes: int):
+        """
+        Writes an evicted asset to the on-disk tier as a raw .npy file
+        """
+        if nbytes > self.disk_max_bytes:
+            return
+        name = hashlib.blake2b(repr(key).encode(), digest_size=20).hexdigest()
+        path = os.path.join(self.disk_dir, f"{name}.npy")
+        if isinstance(value, Image.Image):
+            mode, array = value.mode, np.asarray(value)
+        else:
+            mode, array = None, value
+        try:
+            np.save(path, array, allow_pickle=False)
+        except (OSError, ValueError):
+            _remove_quietly(path)
+            return
+
+        dropped = []
+        with self._lock:
+            previous = self._disk_entries.pop(key, None)
+            if previous is not None:
+                self._disk_bytes -= previous[2]
+            self._disk_entries[key] = (path, mode, nbytes)
+            self._disk_bytes += nbytes
+            while self._disk_bytes > self.disk_max_bytes:
+                _, (old_path, _, old_nbytes) = self._disk_entries.popitem(
+                    last=False
+                )
+                self._disk_bytes -= old_nbytes
+                dropped.append(old_path)
+        for old_path in dropped:
+            if old_path != path:
+                _remove_quietly(old_path)
+
+
+def _read_spilled(path: str, mode: str):
+    array = np.load(path, allow_pickle=False)
+    if mode is None:
+        return array
+    image = Image.fromarray(array)
+    return image if image.mode == mode else image.convert(mode)
+
+
+def _remove_quietly(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+_asset_cache = None
+_asset_cache_lock = threading.Lock()
+
+
+def get_asset_cache() -> AssetCache:
+    """
+    Gets the process-wide AssetCache, created on first use with a size from
+    NVCF_ASSET_CACHE_BYTES and an optional disk tier in NVCF_ASSET_CACHE_DIR
+    :return: AssetCache
+    """
+    global _asset_cache
+
+    if _asset_cache is None:
+        with _asset_cache_lock:
+            if _asset_cache is None:
+                _asset_cache = AssetCache(
+                    max_bytes=int(
+                        os.environ.get(
+                            ASSET_CACHE_BYTES_ENV, DEFAULT_ASSET_CACHE_BYTES
+                        )
+                    ),
+                    disk_dir=os.environ.get(ASSET_CACHE_DIR_ENV),
+                )
+    return _asset_cache
@@ -0,0 +1,363 @@
+import time
+import bisect
+import threading
+from collections import OrderedDict
+import numpy as np
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+LATENCY_MS_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+BUFFER_CACHE_SIZE = (
+    8  # input buffers kept per BatchExecutor, least recently used first dropped
+)
+
+
+class Histogram:
+    """
+    A thread-safe histogram with fixed upper bounds, values above the last bound
+    are counted in an overflow bucket
+    """
+
+    def __init__(self, bounds: tuple):
+        self.bounds = tuple(bounds)
+        self._counts = [0] * (len(self.bounds) + 1)
+        self._count = 0
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        i = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self._counts[i] += 1
+            self._count += 1
+            self._sum += value
+
+    def snapshot(self) -> dict:
+        """
+        :return: dict with the "count", "sum", "mean" and the "buckets" as
+            (upper bound, count) pairs, the overflow bucket has the upper bound
+            inf
+        """
+        with self._lock:
+            counts = list(self._counts)
+            count, total = self._count, self._sum
+        return {
+            "count": count,
+            "sum": total,
+            "mean": total / count if count else 0.0,
+            "buckets": list(zip(self.bounds + (float("inf"),), counts)),
+        }
+
+
+def round_up_shape(multiple: int):
+    """
+    Returns a bucket function for BatchExecutor that pads every non-batch
+    dimension up to a multiple, e.g. round_up_shape(64) puts sequences of length
+    100 and 120 in the same batch of length 128
+    """
+
+    def bucket_shape(shape: tuple) -> tuple:
+        return tuple(-(-d // multiple) * multiple for d in shape)
+
+    return bucket_shape
+
+
+class BatchExecutor:
+    """
+    Runs a model once per batch of Triton Python-backend requests: the input
+    tensors of all requests with the same shape bucket are concatenated (and
+    padded) along the first axis into preallocated buffers, batch_fn is called
+    once per bucket, and its outputs are split back into one
+    InferenceResponse per request, in the order of the requests.
+    Batch sizes and batch_fn latencies are recorded in histograms, see stats().
+
+    The first dimension of every input and output tensor is the batch dimension.
+    batch_fn must not keep references to its input arrays, the buffers are
+    reused by the next batch.
+    The BUFFER_CACHE_SIZE most recently used buffers are kept, concurrent calls
+    of execute() run batch_fn in parallel on separate buffers.
+    With bucket_shape, an output whose leading non-batch dimensions equal the
+    padded shape of an input is cropped back to the shape of that input in each
+    request, e.g. the logits (1, 128, V) of a request of length 100 padded to
+    128 are returned as (1, 100, V).
+
+    Example Usage:
+        class TritonPythonModel:
+            def initialize(self, args):
+                self.executor = BatchExecutor(
+                    self.run_model,
+                    ["INPUT_IDS"],
+                    ["LOGITS"],
+                    max_batch_size=32,
+                    bucket_shape=round_up_shape(64),
+                )
+
+            def run_model(self, input_ids):
+                return self.model(input_ids)
+
+            def execute(self, requests):
+                return self.executor.execute(requests)
+    """
+
+    def __init__(
+        self,
+        batch_fn,
+        input_names: list,
+        output_names: list,
+        max_batch_size: int = None,
+        bucket_shape=None,
+        pad_value=0,
+        crop_outputs: bool = True,
+    ):
+        """
+        :param batch_fn: function called with one numpy array per input name,
+            returning an array or a list of arrays (one per output name) whose
+            first dimension is the batch size
+        :param input_names: names of the input tensors passed to batch_fn, in
+            order
+        :param output_names: names of the output tensors returned by batch_fn,
+            in order
+        :param max_batch_size: maximum sum of the request batch sizes passed to
+            batch_fn at once
+        :param bucket_shape: optional function mapping the non-batch shape of an
+            input to the padded shape it is batched with, e.g.
+            round_up_shape(64). Requests are only batched with requests of the
+            same non-batch shapes by default
+        :param pad_value: value of the padding added by bucket_shape
+        :param crop_outputs: crop the outputs padded by bucket_shape back to the
+            request shapes, set to False to get the padded outputs, e.g. when a
+            non-batch dimension of an output only coincidentally equals the
+            padded length
+        """
+        self.batch_fn = batch_fn
+        self.input_names = list(input_names)
+        self.output_names = list(output_names)
+        self.max_batch_size = max_batch_size
+        self.bucket_shape = bucket_shape
+        self.pad_value = pad_value
+        self.crop_outputs = crop_outputs
+        self.batch_size_histogram = Histogram(BATCH_SIZE_BUCKETS)
+        self.latency_ms_histogram = Histogram(LATENCY_MS_BUCKETS)
+        self._buffers = OrderedDict()  # (input index, bucket, dtype) -> buffer
+        self._lock = threading.Lock()
+
+    def stats(self) -> dict:
+        """
+        :return: snapshots of the batch size and batch_fn latency (milliseconds)
+            histograms
+        """
+        return {
+            "batch_size": self.batch_size_histogram.snapshot(),
+            "latency_ms": self.latency_ms_histogram.snapshot(),
+        }
+
+    def execute(self, requests: list) -> list:
+        """
+        Batches the requests, runs batch_fn and builds the responses
+        :param requests: list of Triton request objects, as passed to execute()
+        :return: list of pb_utils.InferenceResponse, one per request in the same
+            order
+        """
+        # only available inside Triton container
+        import triton_python_backend_utils as pb_utils
+
+        responses = [None] * len(requests)
+        groups = {}
+        for i, request in enumerate(requests):
+            try:
+                arrays = [
+                    _get_input_array(pb_utils, request, name)
+                    for name in self.input_names
+                ]
+            except Exception as e:
+                responses[i] = pb_utils.InferenceResponse(
+                    error=pb_utils.TritonError(str(e))
+                )
+                continue
+            key = tuple(self._bucket_of(a.shape[1:]) for a in arrays)
+            groups.setdefault(key, []).append((i, arrays))
+
+        for key, members in groups.items():
+            for chunk in self._chunks(members):
+                try:
+                    outputs = self._run(key, [arrays for _, arrays in chunk])
+                except Exception as e:
+                    for i, _ in chunk:
+                        responses[i] = pb_utils.InferenceResponse(
+                            error=pb_utils.TritonError(str(e))
+                        )
+                    continue
+                for (i, _), request_outputs in zip(chunk, outputs):
+                    responses[i] = pb_utils.InferenceResponse(
+                        output_tensors=[
+                            pb_utils.Tensor(name, out)
+                            for name, out in zip(
+                                self.output_names, request_outputs
+                            )
+                        ]
+                    )
+        return responses
+
+    def _bucket_of(self, shape: tuple) -> tuple:
+        if self.bucket_shape is None:
+            return tuple(shape)
+        bucket = tuple(self.bucket_shape(tuple(shape)))
+        if len(bucket) != len(shape) or any(
+            b < d for b, d in zip(bucket, shape)
+        ):
+            raise ValueError(
+                f"bucket_shape returned {bucket}, "
+                f"smaller than the input shape {shape}"
+            )
+        return bucket
+
+    def _chunks(self, members: list):
+        """
+        Splits the requests of one bucket into chunks of at most max_batch_size
+        """
+        if self.max_batch_size is None:
+            yield members
+            return
+        chunk, size = [], 0
+        for member in members:
+            n = len(member[1][0]) if member[1] else 1
+            if chunk and size + n > self.max_batch_size:
+                yield chunk
+                chunk, size = [], 0
+            chunk.append(member)
+            size += n
+        if chunk:
+            yield chunk
+
+    def _take_buffer(self, buffer_key: tuple, rows: int) -> np.ndarray:
+        """
+        Takes the cached buffer of an input, bucket and dtype out of the cache,
+        so no other batch uses it, or allocates one. Buffers are allocated for
+        max_batch_size rows.
+        """
+        with self._lock:
+            buffer = self._buffers.pop(buffer_key, None)
+        if buffer is None or len(buffer) < rows:
+            _, bucket, dtype = buffer_key
+            capacity = max(rows, self.max_batch_size or 0)
+            buffer = np.empty((capacity,) + bucket, dtype=dtype)
+        return buffer
+
+    def _return_buffers(self, buffers: dict):
+        """
+        Puts buffers back in the cache, dropping the least recently used beyond
+        BUFFER_CACHE_SIZE
+        """
+        with self._lock:
+            for buffer_key, buffer in buffers.items():
+                self._buffers[buffer_key] = buffer
+                self._buffers.move_to_end(buffer_key)
+            while len(self._buffers) > BUFFER_CACHE_SIZE:
+                self._buffers.popitem(last=False)
+
+    def _run(self, key: tuple, batch: list) -> list:
+        """
+        Concatenates the inputs of a chunk, calls batch_fn and splits its
+        outputs per request
+        :return: list of per-request output lists
+        """
+        sizes = [len(arrays[0]) if arrays else 1 for arrays in batch]
+        offsets = np.cumsum([0] + sizes)
+        total = int(offsets[-1])
+
+        buffers = {}
+        try:
+            inputs = []
+            for index, bucket in enumerate(key):
+                dtype = np.result_type(*(arrays[index] for arrays in batch))
+                buffer_key = (index, bucket, np.dtype(dtype).str)
+                buffers[buffer_key] = self._take_buffer(buffer_key, total)
+                buffer = buffers[buffer_key][:total]
+                for arrays, start, end in zip(batch, offsets, offsets[1:]):
+                    array = arrays[index]
+                    if array.shape[1:] == bucket:
+                        buffer[start:end] = array
+                    else:
+                        buffer[start:end] = self.pad_value
+                        buffer[
+                            (slice(start, end),)
+                            + tuple(slice(0, d) for d in array.shape[1:])
+                        ] = array
+                inputs.append(buffer)
+
+            start_time = time.perf_counter()
+            outputs = self.batch_fn(*inputs)
+            latency_ms = (time.perf_counter() - start_time) * 1000
+            if isinstance(outputs, np.ndarray):
+                outputs = [outputs]
+            outputs = [
+                # never hand out views of the reused input buffers
+                (
+                    np.array(out)
+                    if any(np.may_share_memory(out, b) for b in inputs)
+                    else np.asarray(out)
+                )
+                for out in outputs
+            ]
+        finally:
+            self._return_buffers(buffers)
+
+        self.batch_size_histogram.observe(total)
+        self.latency_ms_histogram.observe(latency_ms)
+
+        if len(outputs) != len(self.output_names):
+            raise ValueError(
+                f"batch_fn returned {len(outputs)} outputs, "
+                f"expected {len(self.output_names)}"
+            )
+        for out in outputs:
+            if len(out) != total:
+                raise ValueError(
+                    f"batch_fn returned an output of batch size {len(out)}, "
+                    f"expected {total}"
+                )
+        crops = self._output_crops(key, outputs)
+        return [
+            [
+                _crop(out[start:end], None if index is None else arrays[index])
+                for out, index in zip(outputs, crops)
+            ]
+            for arrays, start, end in zip(batch, offsets, offsets[1:])
+        ]
+
+    def _output_crops(self, key: tuple, outputs: list) -> list:
+        """
+        For each output, the index of the first input whose padded shape leads
+        its non-batch shape, or None if the output is returned as is
+        """
+        crops = []
+        for out in outputs:
+            index = None
+            if self.bucket_shape is not None and self.crop_outputs:
+                for i, bucket in enumerate(key):
+                    if bucket and out.shape[1 : len(bucket) + 1] == bucket:
+                        index = i
+                        break
+            crops.append(index)
+        return crops
+
+
+def _crop(out: np.ndarray, array: np.ndarray) -> np.ndarray:
+    """
+    Crops the leading non-batch dimensions of a request's output to the shape of
+    its input array
+    """
+    if array is None or out.shape[1 : array.ndim] == array.shape[1:]:
+        return out
+    return np.ascontiguousarray(
+        out[(slice(None),) + tuple(slice(0, d) for d in array.shape[1:])]
+    )
+
+
+def _get_input_array(pb_utils, request, name: str) -> np.ndarray:
+    tensor = pb_utils.get_input_tensor_by_name(request, name)
+    if tensor is None:
+        raise ValueError(f"Input {name} is missing")
+    array = tensor.as_numpy()
+    if array.ndim == 0:
+        array = array.reshape(1)
+    return array
@@ -0,0 +1,426 @@
+import os
+import json
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from .helpers import (
+    LARGE_OUTPUT_MANIFEST,
+    _atomic_output,
+    _iter_chunks,
+    _manifest_lock,
+    _write_file_atomic,
+)
+from .telemetry import instrument
+
+GZIP_BLOCK_SIZE = 1024 * 1024  # bytes compressed independently per thread
+GZIP_LEVEL = 6
+GZIP_WORKERS = os.cpu_count() or 1
+GZIP_MIN_SIZE = 64 * 1024  # bytes, smaller files are not compressed
+GZIP_INCOMPRESSIBLE_RATIO = 0.95  # compressed / original size, else stored
+RESULTS_DIR_ENV = "NVCT_RESULTS_DIR"
+
+_GZIP_WINDOW = 32 * 1024  # deflate window, a block's tail primes the next
+_GZIP_FINAL_BLOCK = b"\x03\x00"  # empty deflate block with the final bit set
+
+
+def _gzip_header(mtime: int, level: int) -> bytes:
+    # magic, deflate, no flags, mtime, extra flags (2: slowest, 4: fastest),
+    # unknown OS
+    extra_flags = 2 if level == 9 else 4 if level == 1 else 0
+    return (
+        b"\x1f\x8b\x08\x00"
+        + (mtime & 0xFFFFFFFF).to_bytes(4, "little")
+        + bytes((extra_flags, 255))
+    )
+
+
+def _deflate_block(block, dictionary: bytes, level: int) -> bytes:
+    """
+    Compresses one block into raw deflate data ending with a sync flush, on a
+    byte boundary and without the final bit, so independently compressed blocks
+    concatenate into one stream. zlib releases the GIL while compressing. Blocks
+    that do not shrink are stored instead.
+    """
+    if dictionary and level:
+        compressor = zlib.compressobj(
+            level, zlib.DEFLATED, -zlib.MAX_WBITS, zdict=dictionary
+        )
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    data = compressor.compress(block) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    if level and len(data) >= len(block):
+        compressor = zlib.compressobj(0, zlib.DEFLATED, -zlib.MAX_WBITS)
+        data = compressor.compress(block) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    return data
+
+
+def _gzip_blocks(
+    source,
+    write,
+    executor,
+    max_workers: int,
+    level: int,
+    block_size: int,
+    mtime: int,
+    abort_incompressible: bool,
+) -> tuple:
+    """
+    Writes source as a single gzip member, compressing its blocks in parallel on
+    executor and writing them in order. Once the first max_workers blocks
+    compressed to more than
+    GZIP_INCOMPRESSIBLE_RATIO of their size, the rest is stored without
+    compression, or nothing more is written with abort_incompressible.
+    :return: (input bytes, output bytes, incompressible), output bytes is None
+        when aborted
+    """
+    header = _gzip_header(mtime, level)
+    write(header)
+    output_bytes = len(header)
+    input_bytes = 0
+    crc = 0
+    dictionary = b""
+    # (block size, future) in input order, bounded so a large source is not read
+    # ahead entirely
+    pending = deque()
+    probe_blocks = max_workers
+    probe_in = probe_out = 0
+    incompressible = False
+
+    def write_block(block_size: int, data: bytes) -> bool:
+        nonlocal output_bytes, probe_blocks, probe_in, probe_out, incompressible
+        write(data)
+        output_bytes += len(data)
+        if probe_blocks:
+            probe_blocks -= 1
+            probe_in += block_size
+            probe_out += len(data)
+            if (
+                not probe_blocks
+                and probe_out > probe_in * GZIP_INCOMPRESSIBLE_RATIO
+            ):
+                incompressible = True
+        return incompressible
+
+    try:
+        for block in _iter_chunks(source, block_size):
+            crc = zlib.crc32(block, crc)
+            input_bytes += len(block)
+            pending.append(
+                (
+                    len(block),
+                    executor.submit(_deflate_block, block, dictionary, level),
+                )
+            )
+            if level:
+                dictionary = bytes(block[-_GZIP_WINDOW:])
+            while len(pending) > 2 * max_workers:
+                size, future = pending.popleft()
+                if write_block(size, future.result()) and level:
+                    if abort_incompressible:
+                        return input_bytes, None, True
+                    level = 0
+        while pending:
+            size, future = pending.popleft()
+            if write_block(size, future.result()) and abort_incompressible:
+                return input_bytes, None, True
+    finally:
+        for _, future in pending:
+            future.cancel()
+
+    trailer = (
+        _GZIP_FINAL_BLOCK
+        + crc.to_bytes(4, "little")
+        + (input_bytes & 0xFFFFFFFF).to_bytes(4, "little")
+    )
+    write(trailer)
+    return input_bytes, output_bytes + len(trailer), incompressible
+
+
+def _compression_report(
+    path: str,
+    input_bytes: int,
+    output_bytes: int,
+    seconds: float,
+    skipped: bool,
+) -> dict:
+    return {
+        "path": path,
+        "skipped": skipped,
+        "input_bytes": input_bytes,
+        "output_bytes": output_bytes,
+        "ratio": output_bytes / input_bytes if input_bytes else 1.0,
+        "seconds": seconds,
+        "mb_per_s": input_bytes / seconds / 1e6 if seconds else 0.0,
+    }
+
+
+def _check_gzip_options(level: int, block_size: int):
+    if not 0 <= level <= 9:
+        raise ValueError(f"level must be between 0 and 9, got {level}")
+    if block_size < _GZIP_WINDOW:
+        raise ValueError(
+            f"block_size must be at least {_GZIP_WINDOW} bytes, "
+            f"got {block_size}"
+        )
+
+
+@instrument("compress", size=lambda args, kwargs, result: result["input_bytes"])
+def gzip_compress_stream(
+    source,
+    destination,
+    level: int = GZIP_LEVEL,
+    block_size: int = GZIP_BLOCK_SIZE,
+    max_workers: int = GZIP_WORKERS,
+    mtime: int = 0,
+) -> dict:
+    """
+    Gzip compresses a stream like pigz: blocks of block_size bytes are
+    compressed independently on a thread pool and written in order as one
+    standard gzip member, readable by gzip, zcat or the gzip module. When the
+    first blocks do not compress below GZIP_INCOMPRESSIBLE_RATIO
+    (e.g. video or images), the rest of the stream is stored without spending
+    time compressing it.
+    :param source: bytes-like object, file-like object opened in binary mode or
+        an iterable of bytes
+    :param destination: file-like object opened in binary mode
+    :param level: zlib compression level, 1 (fastest) to 9 (smallest)
+    :param block_size: bytes per block, larger blocks compress slightly better
+    :param max_workers: number of compressing threads
+    :param mtime: modification time recorded in the gzip header
+    :return: {"path": None, "skipped": True if the data was stored,
+        "input_bytes", "output_bytes", "ratio": output / input size, "seconds",
+        "mb_per_s": input throughput}
+
+    Example Usage:
+        output_dir = get_output_path(request_parameters)
+        with open(os.path.join(output_dir, "points.ply.gz"), "wb") as f:
+            report = gzip_compress_stream(point_cloud_bytes, f)
+        logger.info(
+            f"compressed to {report['ratio']:.0%} "
+            f"at {report['mb_per_s']:.0f} MB/s"
+        )
+    """
+    _check_gzip_options(level, block_size)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(
+        max_workers=max_workers, thread_name_prefix="nvcf-gzip"
+    ) as executor:
+        input_bytes, output_bytes, incompressible = _gzip_blocks(
+            source,
+            destination.write,
+            executor,
+            max_workers,
+            level,
+            block_size,
+            mtime,
+            False,
+        )
+    return _compression_report(
+        None,
+        input_bytes,
+        output_bytes,
+        time.perf_counter() - start,
+        incompressible,
+    )
+
+
+class _Incompressible(Exception):
+    pass
+
+
+def _gzip_file(
+    path: str,
+    output_path: str,
+    executor,
+    max_workers: int,
+    level: int,
+    block_size: int,
+    remove_original: bool,
+    skip_incompressible: bool,
+) -> dict:
+    start = time.perf_counter()
+    try:
+        with open(path, "rb") as infile, _atomic_output(output_path) as outfile:
+            input_bytes, output_bytes, incompressible = _gzip_blocks(
+                infile,
+                outfile.write,
+                executor,
+                max_workers,
+                level,
+                block_size,
+                int(os.fstat(infile.fileno()).st_mtime),
+                skip_incompressible,
+            )
+            if skip_incompressible and (
+                output_bytes is None
+                or output_bytes > input_bytes * GZIP_INCOMPRESSIBLE_RATIO
+            ):
+                # the temporary file is removed instead of being renamed
+                raise _Incompressible()
+    except _Incompressible:
+        size = os.path.getsize(path)
+        return _compression_report(
+            path, size, size, time.perf_counter() - start, True
+        )
+    if remove_original:
+        os.remove(path)
+    return _compression_report(
+        output_path,
+        input_bytes,
+        output_bytes,
+        time.perf_counter() - start,
+        False,
+    )
+
+
+@instrument("compress", size=lambda args, kwargs, result: result["input_bytes"])
+def gzip_compress_file(
+    path: str,
+    output_path: str = None,
+    level: int = GZIP_LEVEL,
+    block_size: int = GZIP_BLOCK_SIZE,
+    max_workers: int = GZIP_WORKERS,
+    remove_original: bool = False,
+    skip_incompressible: bool = True,
+) -> dict:
+    """
+    Gzip compresses a file with gzip_compress_stream, through a temporary file
+    and an atomic rename.
+    Incompressible files are left as they are: compression stops as soon as the
+    first blocks do not shrink enough, and no .gz file is written.
+    :param path: file to compress
+    :param output_path: path of the compressed file, path + ".gz" by default
+    :param remove_original: remove path once it is compressed
+    :param skip_incompressible: set to False to always write the compressed file
+    :return: see gzip_compress_stream, "path" is the compressed file or path
+        when it was skipped
+
+    Example Usage:
+        report = gzip_compress_file(
+            os.path.join(output_dir, "mesh.obj"), remove_original=True
+        )
+    """
+    _check_gzip_options(level, block_size)
+    with ThreadPoolExecutor(
+        max_workers=max_workers, thread_name_prefix="nvcf-gzip"
+    ) as executor:
+        return _gzip_file(
+            path,
+            output_path or f"{path}.gz",
+            executor,
+            max_workers,
+            level,
+            block_size,
+            remove_original,
+            skip_incompressible,
+        )
+
+
+def _update_manifest_for_gzip(directory: str, compressed: dict):
+    """
+    Renames the entries of the manifest.json of directory whose files were
+    compressed
+    :param compressed: {original file name: compression report}
+    """
+    manifest_path = os.path.join(directory, LARGE_OUTPUT_MANIFEST)
+    with _manifest_lock:
+        try:
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            return
+        for entry in manifest["files"]:
+            report = compressed.get(entry["name"])
+            if report is not None:
+                entry["name"] = os.path.basename(report["path"])
+                entry["size"] = report["output_bytes"]
+                entry["content_encoding"] = "gzip"
+        _write_file_atomic(manifest_path, json.dumps(manifest))
+
+
+def gzip_compress_directory(
+    directory: str = None,
+    level: int = GZIP_LEVEL,
+    block_size: int = GZIP_BLOCK_SIZE,
+    max_workers: int = GZIP_WORKERS,
+    min_size: int = GZIP_MIN_SIZE,
+    exclude: tuple = (LARGE_OUTPUT_MANIFEST, "progress"),
+    remove_original: bool = True,
+) -> dict:
+    """
+    Gzip compresses every file of a directory tree in place, e.g. a task result
+    folder before it is uploaded or a large output directory
+    (NVCF-LARGE-OUTPUT-DIR), whose manifest.json entries are renamed to the .gz
+    files with "content_encoding": "gzip".
+    Files are compressed one after another, each on all the threads, see
+    gzip_compress_file.
+    Files smaller than min_size, incompressible files, excluded names and .gz
+    files are left as is.
+    :param directory: directory to compress, the NVCT_RESULTS_DIR environment
+        variable by default
+    :param min_size: minimum size in bytes of a compressed file
+    :param exclude: file names never compressed, by default the manifest and the
+        progress file
+    :param remove_original: replace the files with their compressed version
+    :return: {"files": list of gzip_compress_file reports, "input_bytes",
+        "output_bytes", "ratio", "seconds", "mb_per_s"} totalled over all the
+        files, skipped ones included
+
+    Example Usage:
+        report = gzip_compress_directory(
+            os.path.join(os.environ["NVCT_RESULTS_DIR"], "output")
+        )
+        logger.info(f"results compressed to {report['ratio']:.0%}")
+    """
+    _check_gzip_options(level, block_size)
+    if directory is None:
+        directory = os.environ.get(RESULTS_DIR_ENV)
+        if not directory:
+            raise ValueError(
+                f"No directory given and {RESULTS_DIR_ENV} is not set!"
+            )
+
+    start = time.perf_counter()
+    reports = []
+    with ThreadPoolExecutor(
+        max_workers=max_workers, thread_name_prefix="nvcf-gzip"
+    ) as executor:
+        for root, _, filenames in os.walk(directory):
+            compressed = {}
+            for filename in sorted(filenames):
+                path = os.path.join(root, filename)
+                if (
+                    filename in exclude
+                    or filename.endswith((".gz", ".tmp"))
+                    or not os.path.isfile(path)
+                    or os.path.getsize(path) < min_size
+                ):
+                    continue
+                report = _gzip_file(
+                    path,
+                    f"{path}.gz",
+                    executor,
+                    max_workers,
+                    level,
+                    block_size,
+                    remove_original,
+                    True,
+                )
+                reports.append(report)
+                if not report["skipped"]:
+                    compressed[filename] = report
+            if compressed and remove_original:
+                _update_manifest_for_gzip(root, compressed)
+
+    summary = _compression_report(
+        directory,
+        sum(report["input_bytes"] for report in reports),
+        sum(report["output_bytes"] for report in reports),
+        time.perf_counter() - start,
+        False,
+    )
+    del summary["path"], summary["skipped"]
+    summary["files"] = reports
+    return summary
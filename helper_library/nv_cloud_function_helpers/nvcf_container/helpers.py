@@ -2,30 +2,267 @@ import os
 import io
 import re
 import base64
+import binascii
 import json
+import shutil
+import types
+import hashlib
+import tempfile
+import zipfile
+from collections import OrderedDict, namedtuple
 import sys
 import logging
+import logging.handlers
+import atexit
+import contextvars
+import queue
 import codecs
-import numpy as np
-from PIL import Image
-import requests
+import contextlib
+import weakref
+import mmap
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import TYPE_CHECKING
+
+from .telemetry import instrument
+
+# numpy, PIL, requests and asyncio are imported on first use, so that the
+# request header getters, the secrets and the config helpers do not pay for them
+# at startup
+if TYPE_CHECKING:
+    import requests
+    from PIL import Image
 
 DEFAULT_MAX_NVCF_MSG_SIZE = 5 * 1000 * 1000  # 5MB
 IMAGE_FORMAT = "JPEG"
 IMAGE_QUALITY = 90
 SECRETS_PATH = "/var/secrets/secrets.json"
+BASE64_CHUNK_SIZE = 3 * 64 * 1024  # raw bytes per base64 chunk, multiple of 3
+MAX_PATH_LENGTH = 4096  # inputs longer than PATH_MAX are never probed as paths
+ENCODING_PROFILE_ENV = "NVCF_IMAGE_ENCODING_PROFILE"
+DEFAULT_ENCODING_PROFILE = "balanced"
+
+# encoder settings per profile and image format, the quality is the
+# image_quality argument of the encoding helpers (see get_encoding_options)
+ENCODING_PROFILES = {
+    "fastest": {
+        "JPEG": {"optimize": False},
+        "PNG": {"compress_level": 1},
+        "WEBP": {"method": 0},
+    },
+    "balanced": {
+        "JPEG": {"optimize": True},
+        "PNG": {"compress_level": 6},
+        "WEBP": {"method": 4},
+    },
+    "smallest": {
+        "JPEG": {"optimize": True, "progressive": True},
+        "PNG": {"optimize": True},
+        "WEBP": {"method": 6},
+    },
+}
+_QUALITY_FORMATS = ("JPEG", "WEBP")
+UPLOAD_POOL_SIZE = 10
+UPLOAD_RETRIES = 3
+UPLOAD_BACKOFF_FACTOR = 0.5
+UPLOAD_RETRY_STATUSES = (500, 502, 503, 504)
+MULTIPART_UPLOAD_WORKERS = 4
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+ASYNC_UPLOAD_CONCURRENCY = 8
+PROGRESS_FLUSH_INTERVAL = 1.0  # seconds
+LOG_FORMAT = "%(asctime)s [%(levelname)s] [INFERENCE] %(message)s"
+LOG_FORMAT_ENV = "NVCF_LOG_FORMAT"  # "text" (default) or "json"
+LOG_RATE_LIMIT_INTERVAL = (
+    10.0  # seconds between two warnings from the same line
+)
+LARGE_OUTPUT_MANIFEST = "manifest.json"
+NPZ_CACHE_SIZE = 32  # arrays kept by load_npz(cache=True)
+NPZ_EXTRACT_DIR = None  # <temp dir>/nvcf_npz_cache, resolved on first use
+IMAGE_WRITER_WORKERS = 4
+FSYNC_POLICIES = ("never", "file", "always")
 
 b64_pattern = re.compile(
     "^([A-Za-z0-9+/]{4})*([A-Za-z0-9+/]{3}=|[A-Za-z0-9+/]{2}==)?$"
 )
 
-def upload_file(filename, url, headers, timeout=30):
+if sys.version_info >= (3, 11):
+
+    def _a2b_base64_strict(data) -> bytes:
+        return binascii.a2b_base64(data, strict_mode=True)
+
+else:
+
+    def _a2b_base64_strict(data) -> bytes:
+        return base64.b64decode(data, validate=True)
+
+
+_upload_session = None
+# without urllib3 retries, upload_file_multipart retries each part itself
+_part_upload_session = None
+_upload_session_lock = threading.Lock()
+
+
+def _new_upload_session(
+    pool_size: int = UPLOAD_POOL_SIZE,
+    retries: int = UPLOAD_RETRIES,
+    backoff_factor: float = UPLOAD_BACKOFF_FACTOR,
+    retry_statuses: tuple = UPLOAD_RETRY_STATUSES,
+) -> "requests.Session":
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=retries,
+        status=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=retry_statuses,
+        # return the last response once retries are exhausted
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry
+    )
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def configure_upload_session(
+    pool_size: int = UPLOAD_POOL_SIZE,
+    retries: int = UPLOAD_RETRIES,
+    backoff_factor: float = UPLOAD_BACKOFF_FACTOR,
+    retry_statuses: tuple = UPLOAD_RETRY_STATUSES,
+) -> "requests.Session":
+    """
+    Creates the shared keep-alive session used by upload() and upload_file(),
+    replacing any previous one.
+    Connections are pooled per host so repeated uploads to the same object store
+    skip the TCP/TLS handshake.
+    Failed connections, connection resets and retry_statuses responses are
+    retried with exponential backoff.
+    :param pool_size: maximum number of connections kept alive per host
+    :param retries: number of retries per upload, 0 disables retrying
+    :param backoff_factor: backoff factor in seconds between retries
+    :param retry_statuses: HTTP status codes that are retried
+    :return: the new requests.Session
+    """
+    global _upload_session, _part_upload_session
+
+    session = _new_upload_session(
+        pool_size, retries, backoff_factor, retry_statuses
+    )
+    part_session = _new_upload_session(pool_size, 0)
+    with _upload_session_lock:
+        previous, _upload_session = _upload_session, session
+        previous_part, _part_upload_session = _part_upload_session, part_session
+    for old in (previous, previous_part):
+        if old is not None:
+            old.close()
+    return session
+
+
+def get_upload_session() -> "requests.Session":
+    """
+    Gets the shared upload session, creating it with default settings on first
+    use
+    :return: requests.Session
+    """
+    global _upload_session
+
+    session = _upload_session
+    if session is None:
+        with _upload_session_lock:
+            if _upload_session is None:
+                _upload_session = _new_upload_session()
+            session = _upload_session
+    return session
+
+
+def _get_part_upload_session() -> "requests.Session":
+    """
+    Gets the session of the multipart uploads, whose adapter does not retry
+    """
+    global _part_upload_session
+
+    session = _part_upload_session
+    if session is None:
+        with _upload_session_lock:
+            if _part_upload_session is None:
+                _part_upload_session = _new_upload_session(retries=0)
+            session = _part_upload_session
+    return session
+
+
+_upload_metrics_hooks = []
+
+
+def add_upload_metrics_hook(hook):
+    """
+    Registers a function called after every completed upload with a dict of
+    metrics:
+        {"url": url without the query string, "bytes": payload size, "seconds":
+        duration,
+         "mb_per_s": effective throughput, "status_code": HTTP status code,
+         "bytes_sent": bytes read from the payload, including the ones resent on
+         retries}
+
+    Example Usage:
+        add_upload_metrics_hook(
+            lambda m: slow_uploads.append(m) if m["mb_per_s"] < 10 else None
+        )
+    """
+    _upload_metrics_hooks.append(hook)
+
+
+def remove_upload_metrics_hook(hook):
+    """
+    Unregisters a function added with add_upload_metrics_hook
+    """
+    _upload_metrics_hooks.remove(hook)
+
+
+def _report_upload_metrics(
+    url: str, n_bytes: int, seconds: float, status_code, bytes_sent: int = None
+):
+    if not _upload_metrics_hooks:
+        return
+    metrics = {
+        # presigned URLs carry credentials in the query string
+        "url": url.split("?", 1)[0],
+        "bytes": n_bytes,
+        "seconds": seconds,
+        "mb_per_s": n_bytes / seconds / 1e6 if seconds > 0 else 0.0,
+        "status_code": status_code,
+        "bytes_sent": n_bytes if bytes_sent is None else bytes_sent,
+    }
+    for hook in list(_upload_metrics_hooks):
+        try:
+            hook(metrics)
+        except Exception as e:
+            get_logger().warning(f"Upload metrics hook {hook} failed: {e}")
+
+
+def upload_file(
+    filename,
+    url,
+    headers,
+    timeout=30,
+    progress_callback=None,
+    response_limit: int = None,
+):
     """
     Upload a file.
 
     Returns a dictionary containing a "status_code" and "response".
 
     A 200 or 201 status code will indicate a success.
+    See upload() for progress_callback and response_limit.
 
     Example Usage:
         headers = { "Content-Type": "image/jpg" }
@@ -41,11 +278,22 @@ def upload_file(filename, url, headers, timeout=30):
             # Failure
     """
     with open(filename, "rb") as _f:
-        response = upload(_f, url, headers, timeout)
+        response = upload(
+            _f, url, headers, timeout, progress_callback, response_limit
+        )
 
     return response
 
-def upload(stream, url, headers, timeout=30):
+
+@instrument("upload")
+def upload(
+    stream,
+    url,
+    headers,
+    timeout=30,
+    progress_callback=None,
+    response_limit: int = None,
+):
     """
     Upload file/byte stream to S3.
 
@@ -53,6 +301,14 @@ def upload(stream, url, headers, timeout=30):
 
     A 200 or 201 status code will indicate a success.
 
+    stream can be a file object, an iterable of bytes or a bytes-like object
+    (bytes, bytearray, memoryview, mmap), bytes-like objects are sent without
+    being copied. progress_callback(bytes_sent, total_bytes) is called as the
+    body is read, total_bytes is 0 if unknown. response_limit caps how many
+    bytes of the response body are read into "response".
+    Duration, bytes and throughput of the upload are passed to the
+    add_upload_metrics_hook functions.
+
     Example Usage:
         headers = { "Content-Type": "image/jpg" }
         try:
@@ -67,13 +323,510 @@ def upload(stream, url, headers, timeout=30):
         else:
             # Failure
     """
-    response = requests.put(url, headers=headers, data=stream, timeout=timeout)
+    response = _put(
+        stream,
+        url,
+        headers,
+        timeout,
+        progress_callback,
+        stream_response=response_limit is not None,
+    )
+    if response_limit is None:
+        text = response.text
+    else:
+        raw = response.raw.read(response_limit, decode_content=True)
+        response.close()
+        text = raw.decode(response.encoding or "utf-8", "replace")
+
+    return {
+        "status_code": response.status_code,
+        "response": text,
+    }
+
+
+def _put(
+    stream,
+    url,
+    headers,
+    timeout,
+    progress_callback=None,
+    stream_response: bool = False,
+    session: "requests.Session" = None,
+) -> "requests.Response":
+    """
+    PUTs stream through session, the shared one by default, and reports the
+    upload metrics
+    """
+    body = _UploadReader.wrap(stream, progress_callback)
+    start = time.perf_counter()
+    if session is None:
+        session = get_upload_session()
+    response = session.put(
+        url, headers=headers, data=body, timeout=timeout, stream=stream_response
+    )
+    seconds = time.perf_counter() - start
+    bytes_sent = None
+    if isinstance(body, _UploadReader):
+        # the payload size, urllib3 retries read the body again
+        bytes_sent = body.bytes_read
+        n_bytes = len(body) or bytes_sent
+    else:
+        n_bytes = len(stream) if isinstance(stream, (str, bytes)) else 0
+    _report_upload_metrics(
+        url, n_bytes, seconds, response.status_code, bytes_sent
+    )
+    return response
+
+
+class _UploadReader:
+    """
+    File-like wrapper of an upload body that counts the bytes requests reads
+    from it and reports the progress, seeking is forwarded so urllib3 can still
+    rewind on retries.
+    """
+
+    def __init__(self, body, progress_callback=None):
+        self._body = body
+        self._callback = progress_callback
+        from requests.utils import super_len
+
+        self._total = super_len(body)
+        try:
+            self._start = body.tell()
+        except (AttributeError, OSError):
+            self._start = None
+        self.position = 0
+        self.bytes_read = 0
+
+    @classmethod
+    def wrap(cls, stream, progress_callback=None):
+        """
+        Wraps file objects and bytes-like objects, other bodies (str, dicts,
+        generators) are passed to requests unchanged
+        """
+        if isinstance(stream, (bytearray, memoryview, mmap.mmap)) or (
+            isinstance(stream, bytes) and progress_callback is not None
+        ):
+            # requests would iterate bytearray/memoryview/mmap byte by byte
+            stream = _BufferReader(stream)
+        if hasattr(stream, "read"):
+            return cls(stream, progress_callback)
+        return stream
+
+    def __len__(self) -> int:
+        return self._total
+
+    def __bool__(self) -> bool:
+        # requests drops falsy bodies, and __len__ is 0 when the length is
+        # unknown (pipes)
+        return True
+
+    def __iter__(self):
+        # makes requests treat the wrapper as a stream, sent chunked when its
+        # length is unknown
+        while True:
+            chunk = self.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+    def read(self, size: int = -1):
+        chunk = self._body.read(size)
+        if chunk:
+            self.position += len(chunk)
+            self.bytes_read += len(chunk)
+            if self._callback is not None:
+                self._callback(self.position, self._total)
+        return chunk
+
+    def tell(self) -> int:
+        if self._start is None:
+            raise io.UnsupportedOperation("upload body is not seekable")
+        return self._body.tell() - self._start
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if self._start is None:
+            raise io.UnsupportedOperation("upload body is not seekable")
+        if whence == io.SEEK_SET:
+            offset += self._start
+        self.position = self._body.seek(offset, whence) - self._start
+        return self.position
+
+
+class _BufferReader:
+    """
+    Read-only file-like view over a bytes-like object (bytes, memoryview, mmap).
+    requests sends it with a Content-Length and reads it block by block as
+    memoryview slices, so the buffer is never copied, and urllib3 can seek
+    back to the start when it retries.
+    """
+
+    def __init__(self, buffer):
+        self._view = memoryview(buffer).cast("B")
+        self._pos = 0
+
+    def __len__(self) -> int:
+        return len(self._view)
+
+    def read(self, size: int = -1) -> memoryview:
+        end = len(self._view)
+        if size is not None and size >= 0:
+            end = min(self._pos + size, end)
+        chunk = self._view[self._pos : end]
+        self._pos = end
+        return chunk
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += len(self._view)
+        self._pos = min(max(offset, 0), len(self._view))
+        return self._pos
+
+    def close(self):
+        self._view.release()
+
+
+def _upload_part(
+    part: memoryview,
+    part_number: int,
+    url: str,
+    headers: dict,
+    timeout,
+    retries: int,
+    backoff_factor: float,
+) -> dict:
+    """
+    Uploads one part of a multipart upload, retrying failed connections and 5xx
+    responses.
+    The part session does not retry, so this loop is the only retry layer and
+    attempts is exact.
+    :return: the manifest entry of the part
+    """
+    import requests
+
+    session = _get_part_upload_session()
+    attempt = 0
+    while True:
+        attempt += 1
+        reader = _BufferReader(part)
+        try:
+            response = _put(
+                reader, url, dict(headers), timeout, session=session
+            )
+            if response.status_code < 500 or attempt > retries:
+                break
+        except requests.exceptions.RequestException:
+            if attempt > retries:
+                raise
+        finally:
+            reader.close()
+        time.sleep(backoff_factor * 2 ** (attempt - 1))
+
+    return {
+        "part_number": part_number,
+        "etag": response.headers.get("ETag"),
+        "size": len(part),
+        "status_code": response.status_code,
+        "attempts": attempt,
+    }
+
+
+@instrument("upload_multipart")
+def upload_file_multipart(
+    filename,
+    part_urls: list,
+    headers: dict = None,
+    part_size: int = None,
+    timeout=30,
+    max_workers: int = MULTIPART_UPLOAD_WORKERS,
+    retries: int = UPLOAD_RETRIES,
+    backoff_factor: float = UPLOAD_BACKOFF_FACTOR,
+) -> dict:
+    """
+    Upload a large file in parts to a list of presigned part URLs (e.g. an S3
+    multipart upload).
+    Parts are memory-mapped slices of the file, uploaded concurrently and
+    retried individually.
+
+    Returns a completion manifest containing a "status_code", the total "size"
+    and the "parts":
+        {
+            "status_code": 200,
+            "size": 104857600,
+            "parts": [
+                {"part_number": 1, "etag": "...", "size": 52428800,
+                "status_code": 200, "attempts": 1},
+                ...
+            ],
+        }
+    "status_code" is 200 when every part succeeded, otherwise the status code of
+    the first failed part.
+    The part numbers and ETags are what the object store expects to complete the
+    upload.
+
+    :param filename: path of the file to upload
+    :param part_urls: presigned URLs of parts 1..N, in order
+    :param headers: headers sent with every part
+    :param part_size: bytes per part, defaults to splitting the file evenly
+        across part_urls
+    :param timeout: timeout of each part request
+    :param max_workers: number of parts uploaded concurrently
+    :param retries: number of retries per part
+    :param backoff_factor: backoff factor in seconds between retries of a part
+
+    Example Usage:
+        manifest = upload_file_multipart(
+            "output.tar", presigned_part_urls, part_size=64 * 1024 * 1024
+        )
+        if manifest["status_code"] == 200:
+            complete_upload(
+                [(p["part_number"], p["etag"]) for p in manifest["parts"]]
+            )
+    """
+    if not part_urls:
+        raise ValueError("At least one part URL is required!")
+
+    size = os.path.getsize(filename)
+    if part_size is None:
+        part_size = max(1, -(-size // len(part_urls)))
+    n_parts = max(1, -(-size // part_size))
+    if n_parts > len(part_urls):
+        raise ValueError(
+            f"{filename} needs {n_parts} parts of {part_size} bytes "
+            f"but only {len(part_urls)} part URLs were given!"
+        )
+    headers = headers or {}
+
+    with open(filename, "rb") as f:
+        # an empty file cannot be memory-mapped
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        view = memoryview(mm)
+        try:
+            with ThreadPoolExecutor(
+                max_workers=max(1, min(max_workers, n_parts))
+            ) as pool:
+                futures = [
+                    pool.submit(
+                        _upload_part,
+                        view[i * part_size : (i + 1) * part_size],
+                        i + 1,
+                        part_urls[i],
+                        headers,
+                        timeout,
+                        retries,
+                        backoff_factor,
+                    )
+                    for i in range(n_parts)
+                ]
+                parts = [future.result() for future in futures]
+        finally:
+            view.release()
+            if size:
+                try:
+                    mm.close()
+                except BufferError:
+                    # a part is still referenced by a traceback, closed on
+                    # collection
+                    pass
+
+    failed = [p["status_code"] for p in parts if p["status_code"] >= 300]
+    return {
+        "status_code": failed[0] if failed else 200,
+        "size": size,
+        "parts": parts,
+    }
+
+
+_async_upload_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_upload_client():
+    """
+    Gets the keep-alive httpx.AsyncClient used by aupload() and aupload_file()
+    for the running event loop, creating it on first use. Requires the optional
+    httpx dependency (nv_cloud_function_helpers[async]).
+    :return: httpx.AsyncClient
+    """
+    import asyncio
+    import httpx  # optional dependency, only needed for the async API
+
+    loop = asyncio.get_running_loop()
+    client = _async_upload_clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=UPLOAD_POOL_SIZE,
+                max_keepalive_connections=UPLOAD_POOL_SIZE,
+            ),
+            # retries failed connection attempts, like the sync session
+            transport=httpx.AsyncHTTPTransport(retries=UPLOAD_RETRIES),
+        )
+        _async_upload_clients[loop] = client
+    return client
+
+
+async def _aiter_file(f, chunk_size: int = UPLOAD_CHUNK_SIZE):
+    """
+    Reads a blocking file object chunk by chunk on the default executor
+    so the event loop is never blocked by disk I/O
+    """
+    import asyncio
+
+    loop = asyncio.get_running_loop()
+    while True:
+        chunk = await loop.run_in_executor(None, f.read, chunk_size)
+        if not chunk:
+            break
+        yield chunk
+
+
+async def _aiter_buffer(buffer, chunk_size: int = UPLOAD_CHUNK_SIZE):
+    """
+    Yields memoryview slices of a bytes-like object without copying it
+    """
+    view = memoryview(buffer).cast("B")
+    for start in range(0, len(view), chunk_size):
+        yield view[start : start + chunk_size]
+
+
+async def _aiter_counted(chunks, counter: list, progress_callback, total: int):
+    """
+    Passes chunks through, counting the bytes in counter[0] and reporting the
+    progress
+    """
+    async for chunk in chunks:
+        counter[0] += len(chunk)
+        if progress_callback is not None:
+            progress_callback(counter[0], total)
+        yield chunk
+
+
+@instrument("upload")
+async def aupload(
+    stream, url, headers, timeout=30, client=None, progress_callback=None
+) -> dict:
+    """
+    Upload file/byte stream to S3 without blocking the event loop.
+
+    Returns a dictionary containing a "status_code" and "response", like
+    upload().
+
+    :param stream: a bytes-like object (sent without copying), an async iterable
+        of bytes or a file object opened in binary mode
+    :param client: an httpx.AsyncClient, defaults to get_async_upload_client()
+    :param progress_callback: called with (bytes_sent, total_bytes) as the body
+        is sent
+
+    Example Usage:
+        headers = { "Content-Type": "image/jpg" }
+        response = await aupload(image_bytes, some_s3_url, headers)
+        if response["status_code"] in (200, 201):
+            # Success
+    """
+    if client is None:
+        client = get_async_upload_client()
+
+    total = None
+    if hasattr(stream, "read"):
+        try:
+            total = os.fstat(stream.fileno()).st_size - stream.tell()
+        except (AttributeError, OSError):
+            pass
+        chunks = _aiter_file(stream)
+    elif isinstance(stream, (bytes, bytearray, memoryview, mmap.mmap)):
+        with memoryview(stream) as view:
+            total = view.nbytes
+        chunks = _aiter_buffer(stream)
+    else:
+        chunks = stream
+    if total is not None and not any(
+        k.lower() == "content-length" for k in headers
+    ):
+        # object stores reject chunked uploads
+        headers = {**headers, "Content-Length": str(total)}
+
+    counter = [0]
+    start = time.perf_counter()
+    response = await client.put(
+        url,
+        headers=headers,
+        content=_aiter_counted(chunks, counter, progress_callback, total or 0),
+        timeout=timeout,
+    )
+    _report_upload_metrics(
+        url, counter[0], time.perf_counter() - start, response.status_code
+    )
 
     return {
         "status_code": response.status_code,
         "response": response.text,
     }
 
+
+async def aupload_file(
+    filename, url, headers, timeout=30, client=None, progress_callback=None
+) -> dict:
+    """
+    Upload a file without blocking the event loop, the file is streamed in
+    chunks read on the default executor.
+
+    Returns a dictionary containing a "status_code" and "response", like
+    upload_file().
+
+    Example Usage:
+        headers = { "Content-Type": "image/jpg" }
+        response = await aupload_file("image.jpg", some_s3_url, headers)
+    """
+    import asyncio
+
+    f = await asyncio.get_running_loop().run_in_executor(
+        None, open, filename, "rb"
+    )
+    try:
+        return await aupload(
+            f, url, headers, timeout, client, progress_callback
+        )
+    finally:
+        f.close()
+
+
+async def gather_uploads(
+    uploads,
+    max_concurrency: int = ASYNC_UPLOAD_CONCURRENCY,
+    return_exceptions=False,
+) -> list:
+    """
+    Runs upload coroutines with at most max_concurrency of them in flight at a
+    time and returns their results in the same order.
+    :param uploads: iterable of awaitables, e.g. aupload_file(...) calls
+    :param max_concurrency: maximum number of concurrent uploads
+    :param return_exceptions: return exceptions as results instead of raising
+        the first one
+
+    Example Usage:
+        results = await gather_uploads(
+            aupload_file(path, url, headers)
+            for path, url in zip(paths, presigned_urls)
+        )
+    """
+    import asyncio
+
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def _bounded(upload):
+        async with semaphore:
+            return await upload
+
+    return await asyncio.gather(
+        *(_bounded(u) for u in uploads), return_exceptions=return_exceptions
+    )
+
+
 def _uppercase_dict_keys(d: dict) -> dict:
     """
     Converts all keys in a dictionary to upper case
@@ -83,42 +836,356 @@ def _uppercase_dict_keys(d: dict) -> dict:
     return {k.upper(): v for k, v in d.items()}
 
 
-def get_logger() -> logging.Logger:
+_log_request_id = contextvars.ContextVar("nvcf_log_request_id", default="")
+_log_listener = None
+_log_lock = threading.Lock()
+
+
+def set_log_request_id(request_parameters) -> contextvars.Token:
     """
-    gets a Logger that logs in a format compatible with NVCF
-    :return: logging.Logger
+    Sets the request ID attached to log records of the current thread/task,
+    it is part of every line in the JSON log format
+    :param request_parameters: a dict of the parameters passed to the function,
+        a RequestContext or a request id str
+    :return: a token to restore the previous request ID with
+        reset_log_request_id
+    """
+    if isinstance(request_parameters, str):
+        request_id = request_parameters
+    else:
+        request_id = RequestContext.from_request(request_parameters).request_id
+    return _log_request_id.set(request_id)
+
+
+def reset_log_request_id(token: contextvars.Token):
+    """
+    Restores the request ID that was set before set_log_request_id returned
+    token
+    """
+    _log_request_id.reset(token)
+
+
+class _RequestIdFilter(logging.Filter):
     """
+    Attaches the current request ID to records, runs in the logging thread
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = _log_request_id.get()
+        return True
+
+
+class _RateLimitFilter(logging.Filter):
+    """
+    Lets a warning logged from the same line through at most once per interval
+    and reports how many were dropped in the meantime. Keying on the call site
+    rather than the text keeps the state bounded when messages interpolate
+    values.
+    """
+
+    def __init__(self, interval: float = LOG_RATE_LIMIT_INTERVAL):
+        super().__init__()
+        self.interval = interval
+        self._last = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno != logging.WARNING:
+            return True
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            last, suppressed = self._last.get(key, (None, 0))
+            if last is not None and now - last < self.interval:
+                self._last[key] = (last, suppressed + 1)
+                return False
+            self._last[key] = (now, 0)
+        if suppressed:
+            record.msg = (
+                f"{record.msg} (suppressed {suppressed} similar messages)"
+            )
+        return True
+
+
+class _JsonFormatter(logging.Formatter):
+    """
+    Formats records as one JSON object per line
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", ""),
+            "message": record.getMessage(),
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def _restart_log_listener():
+    # the listener thread does not survive a fork, start a new one in the child
+    if _log_listener is not None:
+        _log_listener._thread = None
+        _log_listener.start()
+
+
+def _configure_logging(json_format: bool = None):
+    """
+    Sends the root logger's records through a queue to a background thread
+    writing to stdout, the same way logging.basicConfig would configure it: only
+    if the root logger has no handlers yet
+    """
+    global _log_listener
+
+    if json_format is None:
+        json_format = os.environ.get(LOG_FORMAT_ENV, "text").lower() == "json"
+
     sys.stdout.reconfigure(encoding="utf-8")
-    logging.basicConfig(
-        level=logging.INFO,
-        format="%(asctime)s [%(levelname)s] [INFERENCE] %(message)s",
-        handlers=[logging.StreamHandler(sys.stdout)],
+    stream_handler = logging.StreamHandler(sys.stdout)
+    if json_format:
+        stream_handler.setFormatter(_JsonFormatter())
+    else:
+        stream_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    listener = logging.handlers.QueueListener(
+        queue.SimpleQueue(), stream_handler, respect_handler_level=True
     )
-    logger = logging.getLogger(__name__)
-    return logger
+    queue_handler = logging.handlers.QueueHandler(listener.queue)
+    queue_handler.addFilter(_RequestIdFilter())
+
+    root = logging.getLogger()
+    if not root.handlers:
+        root.addHandler(queue_handler)
+        root.setLevel(logging.INFO)
+        listener.start()
+        atexit.register(listener.stop)
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=_restart_log_listener)
+    _log_listener = listener
+
+    logging.getLogger(__name__).addFilter(_RateLimitFilter())
+
+
+def get_logger(json_format: bool = None) -> logging.Logger:
+    """
+    gets a Logger that logs in a format compatible with NVCF.
+    Logging is configured on the first call only: records are queued and written
+    to stdout by a background thread so request threads never block on the
+    stream, and repeated warnings from the same line of this module are rate
+    limited.
+    :param json_format: log one JSON object per line including the request ID
+        (see set_log_request_id), defaults to the NVCF_LOG_FORMAT environment
+        variable. Only used on the first call.
+    :return: logging.Logger
+    """
+    if _log_listener is None:
+        with _log_lock:
+            if _log_listener is None:
+                _configure_logging(json_format)
+    return logging.getLogger(__name__)
 
 
+@contextlib.contextmanager
+def _atomic_output(path: str, mode: str = "wb", fsync: str = "never"):
+    """
+    Opens a temporary file next to path and renames it over path when the block
+    succeeds, so readers never see a partially written file. The temporary file
+    is removed if the block fails.
+    :param mode: "wb" or "w"
+    :param fsync: "never", "file" to fsync the file before the rename, or
+        "always" to also fsync the directory after the rename
+    """
+    if fsync not in FSYNC_POLICIES:
+        raise ValueError(
+            f"Unexpected fsync policy {fsync}, expected one of {FSYNC_POLICIES}"
+        )
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, mode) as outfile:
+            yield outfile
+            if fsync != "never":
+                outfile.flush()
+                os.fsync(outfile.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    if fsync == "always":
+        fd = os.open(os.path.dirname(path) or ".", os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+def _write_file_atomic(path: str, data, fsync: str = "never"):
+    """
+    Writes data atomically to path, see _atomic_output
+    :param data: str, bytes-like object or a file-like object opened in binary
+        mode, copied in chunks
+    """
+    with _atomic_output(
+        path, "w" if isinstance(data, str) else "wb", fsync
+    ) as f:
+        if hasattr(data, "read"):
+            shutil.copyfileobj(data, f, UPLOAD_CHUNK_SIZE)
+        else:
+            f.write(data)
+
+
+@instrument("progress_write")
 def update_progress_file(
     request_parameters: dict, progress_value: int, partial_response: dict = {}
 ):
     """
-    A function that creates a file in the format NVCF expects to report process of a long-running function
+    A function that creates a file in the format NVCF expects to report process
+    of a long-running function.
+    The file is replaced atomically. Use ProgressReporter to report progress
+    from a loop.
     :param request_parameters: a dict of the parameters passed to the function
     :param progress_value: an integer value from 0 to 100 that describes the progress currently is
     :param partial_response: an optional dict of information to pass
     :return:
     """
-    p = get_output_path(request_parameters)
+    ctx = RequestContext.from_request(request_parameters)
+    p = ctx.output_path
     structure = {
-        "id": get_request_id(request_parameters),
+        "id": ctx.request_id,
         "progress": progress_value,
     }
 
     structure.update({"partialResponse": partial_response})
 
-    with open(os.path.join(p, "progress"), "w") as outfile:
-        # Write the dictionary to the file in JSON format
-        json.dump(structure, outfile)
+    # Write the dictionary to the file in JSON format
+    _write_file_atomic(os.path.join(p, "progress"), json.dumps(structure))
+
+
+class ProgressReporter:
+    """
+    Reports the progress of a long-running function in the file format NVCF
+    expects, like update_progress_file, without writing the file on every
+    update.
+    Updates are coalesced in memory and written by a background thread at most
+    every min_interval seconds, progress values 0 and 100 are written
+    immediately. Every write replaces the file atomically.
+
+    Example Usage:
+        with ProgressReporter(request_parameters) as reporter:
+            for step in range(steps):
+                ...
+                reporter.update(100 * step // steps, {"step": step})
+            reporter.update(100, {"result": "done"})
+    """
+
+    def __init__(
+        self,
+        request_parameters: dict,
+        min_interval: float = PROGRESS_FLUSH_INTERVAL,
+    ):
+        """
+        :param request_parameters: a dict of the parameters passed to the
+            function or a RequestContext
+        :param min_interval: minimum number of seconds between two writes of the
+            progress file
+        """
+        ctx = RequestContext.from_request(request_parameters)
+        self.path = os.path.join(ctx.output_path, "progress")
+        self.min_interval = min_interval
+        # the request id never changes, serialize it once
+        self._prefix = f'{{"id": {json.dumps(ctx.request_id)}, "progress": '
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._pending = None
+        self._last_write = 0.0
+        self._thread = None
+        self._closed = False
+
+    def __enter__(self) -> "ProgressReporter":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def update(self, progress_value: int, partial_response: dict = None):
+        """
+        Records the current progress, it is written by the background thread
+        unless progress_value is 0 or 100
+        :param progress_value: an integer value from 0 to 100 that describes the
+            progress currently is
+        :param partial_response: an optional dict of information to pass
+        """
+        with self._cond:
+            if self._closed:
+                raise ValueError("ProgressReporter is closed")
+            self._pending = (progress_value, partial_response)
+            if progress_value not in (0, 100):
+                if self._thread is None:
+                    self._thread = threading.Thread(
+                        target=self._run, name="nvcf-progress", daemon=True
+                    )
+                    self._thread.start()
+                self._cond.notify()
+                return
+        self.flush()
+
+    def flush(self):
+        """
+        Writes the latest pending update now
+        """
+        with self._write_lock:
+            with self._cond:
+                pending, self._pending = self._pending, None
+            if pending is not None:
+                self._write(*pending)
+
+    def close(self):
+        """
+        Writes the latest pending update and stops the background thread
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+
+    def _serialize(self, progress_value, partial_response) -> str:
+        if partial_response:
+            partial = json.dumps(partial_response)
+        else:
+            partial = "{}"
+        return (
+            f"{self._prefix}{json.dumps(progress_value)}, "
+            f'"partialResponse": {partial}}}'
+        )
+
+    @instrument("progress_write")
+    def _write(self, progress_value, partial_response):
+        _write_file_atomic(
+            self.path, self._serialize(progress_value, partial_response)
+        )
+        self._last_write = time.monotonic()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._pending is None and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return  # close() writes what is left
+                delay = self._last_write + self.min_interval - time.monotonic()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+            self.flush()
 
 
 def get_scalar_inputs(request, pairs: list) -> list:
@@ -133,14 +1200,7 @@ def get_scalar_inputs(request, pairs: list) -> list:
 
     inputs = []
     for p in pairs:
-        # split pair into key and value
-        if len(p) == 2:
-            k, v = p
-        elif len(p) == 1:
-            # if only one value is given, treat as a key
-            k, v = p[0], None
-        else:
-            raise ValueError(f"Incorrect pair (f{p}) was passed to get input")
+        k, v = _split_input_pair(p)
 
         input = pb_utils.get_input_tensor_by_name(request, k)
         if input is None:
@@ -158,20 +1218,258 @@ def get_scalar_inputs(request, pairs: list) -> list:
     return inputs
 
 
+def _split_input_pair(p) -> tuple:
+    """
+    splits an input declaration of get_scalar_inputs into key and default value
+    """
+    if len(p) == 2:
+        k, v = p
+    elif len(p) == 1:
+        # if only one value is given, treat as a key
+        k, v = p[0], None
+    else:
+        raise ValueError(f"Incorrect pair (f{p}) was passed to get input")
+    return k, v
+
+
+def _decode_utf8(values):
+    """
+    decode the bytes elements of an array, leaving other elements unchanged
+    """
+    import numpy as np
+
+    decode = np.frompyfunc(
+        lambda b: b.decode("utf-8", "ignore") if isinstance(b, bytes) else b,
+        1,
+        1,
+    )
+    return decode(values)
+
+
+def _default_filled_dtype(values, default):
+    """
+    dtype that holds both the values found and the default without truncating
+    either, values is None when no request set the input
+    """
+    import numpy as np
+
+    # text columns are object arrays whether or not a request set the input
+    if default is None or isinstance(default, (str, bytes)):
+        return object
+    if values is None:
+        return None
+    if values.dtype == object:
+        return object
+    try:
+        # the dtype of the default itself: NumPy 2 (NEP 50) no longer widens
+        # for Python scalars, np.result_type(np.int8, 1000) is int8
+        default_dtype = np.asarray(default).dtype
+        if default_dtype.kind in "iu" and values.dtype.kind in "iu":
+            info = np.iinfo(values.dtype)
+            if info.min <= default <= info.max:
+                return values.dtype
+            default_dtype = np.min_scalar_type(default)
+        elif default_dtype.kind == "f" and values.dtype.kind == "f":
+            default_dtype = values.dtype
+        return np.result_type(values.dtype, default_dtype)
+    except (TypeError, ValueError):
+        return object
+
+
+def get_batch_scalar_inputs(
+    requests: list, pairs: list, return_masks: bool = False
+) -> list:
+    """
+    A function built for use within the Triton Inference Server Python-backend
+    with dynamic batching that converts the scalar tensors of a list of requests
+    into one numpy array per input, the vectorized counterpart of
+    get_scalar_inputs.
+    Requests missing an input get its default value, BYTES inputs are decoded as
+    utf-8 in one pass.
+    :param requests: list of Triton request objects, as passed to execute()
+    :param pairs: list of tuple key/default value or single key
+    :param return_masks: also return, per input, a bool array of the requests
+        that set it
+    :return: list of numpy arrays of len(requests), or a tuple (arrays, masks)
+        if return_masks
+
+    Example Usage:
+        def execute(self, requests):
+            prompts, steps = get_batch_scalar_inputs(
+                requests, [("prompt", ""), ("steps", 50)]
+            )
+    """
+    import numpy as np
+
+    # only available inside Triton container
+    import triton_python_backend_utils as pb_utils
+
+    n = len(requests)
+    inputs = []
+    masks = []
+    for p in pairs:
+        k, v = _split_input_pair(p)
+
+        mask = np.zeros(n, dtype=bool)
+        found = []
+        for i, request in enumerate(requests):
+            tensor = pb_utils.get_input_tensor_by_name(request, k)
+            if tensor is not None:
+                mask[i] = True
+                found.append(tensor.as_numpy().reshape(-1))
+
+        if found:
+            values = np.concatenate(found)
+            if len(values) != len(found):
+                raise ValueError(f"Input {k} is not a scalar in every request")
+            if values.dtype == object or values.dtype.kind == "S":
+                # handle byte input, element-wise: a fixed-width bytes array
+                # would be as wide as the longest value and strip trailing NULs
+                values = _decode_utf8(values).astype(object)
+
+        if not found:
+            # also covers an empty list of requests
+            column = np.full(n, v, dtype=_default_filled_dtype(None, v))
+        elif mask.all():
+            column = values
+        else:
+            column = np.full(n, v, dtype=_default_filled_dtype(values, v))
+            column[mask] = values
+
+        inputs.append(column)
+        masks.append(mask)
+
+    if return_masks:
+        return inputs, masks
+    return inputs
+
+
+class RequestContext:
+    """
+    The NVCF fields of a single function invocation message.
+    The header keys are normalized once when the context is created and the
+    typed fields (asset IDs, max response size) are parsed on first access,
+    so a context can be passed around instead of the raw request parameters.
+
+    Example Usage:
+        ctx = RequestContext(request.headers)
+        output_path = get_output_path(ctx)  # every getter accepts a context
+        if len(payload) > ctx.max_msg_size:
+            ...
+    """
+
+    __slots__ = ("_headers", "_asset_ids", "_max_msg_size")
+
+    def __init__(self, request_parameters: dict):
+        """
+        :param request_parameters: a dict of the parameters passed to the
+            function
+        """
+        self._headers = _uppercase_dict_keys(request_parameters)
+        self._asset_ids = None
+        self._max_msg_size = None
+
+    @classmethod
+    def from_request(cls, request_parameters) -> "RequestContext":
+        """
+        Returns request_parameters unchanged if it is already a RequestContext,
+        otherwise builds a new one from it
+        :param request_parameters: a dict of the parameters passed to the
+            function or a RequestContext
+        :return: RequestContext
+        """
+        if isinstance(request_parameters, cls):
+            return request_parameters
+        return cls(request_parameters)
+
+    def __repr__(self) -> str:
+        return f"RequestContext(request_id={self.request_id!r})"
+
+    def get(self, key: str, default=None):
+        """
+        Gets any parameter of the invocation message, the key is
+        case-insensitive
+        :param key: the parameter name
+        :param default: value returned when the parameter is missing
+        :return: the parameter value
+        """
+        return self._headers.get(key.upper(), default)
+
+    @property
+    def headers(self) -> dict:
+        """
+        :return: the invocation parameters with upper case keys
+        """
+        return self._headers
+
+    @property
+    def request_id(self) -> str:
+        return self._headers.get("NVCF-REQID", "")
+
+    @property
+    def nca_id(self) -> str:
+        return self._headers.get("NVCF-NCAID", "")
+
+    @property
+    def function_id(self) -> str:
+        return self._headers.get("NVCF-FUNCTION-ID", "")
+
+    @property
+    def function_name(self) -> str:
+        return self._headers.get("NVCF-FUNCTION-NAME", "")
+
+    @property
+    def properties_sub(self) -> str:
+        return self._headers.get("NVCF-SUB", "")
+
+    @property
+    def output_path(self) -> str:
+        output_path = self._headers.get("NVCF-LARGE-OUTPUT-DIR")
+        if output_path is None:
+            output_path = f"/var/inf/response/{self.request_id}"
+        return output_path
+
+    @property
+    def input_path(self) -> str:
+        input_path = self._headers.get("NVCF-ASSET-DIR")
+        if input_path is None:
+            input_path = f"/var/inf/inputAssets/{self.request_id}"
+        return input_path
+
+    @property
+    def asset_ids(self) -> tuple:
+        if self._asset_ids is None:
+            s = self._headers.get("NVCF-FUNCTION-ASSET-IDS", "")
+            self._asset_ids = tuple(s.split(","))
+        return self._asset_ids
+
+    @property
+    def max_msg_size(self) -> int:
+        if self._max_msg_size is None:
+            max_response_size = self._headers.get(
+                "NVCF-MAX-RESPONSE-SIZE-BYTES"
+            )
+            if max_response_size is None:
+                l = get_logger()
+                l.warning(
+                    "Could not find 'NVCF-MAX-RESPONSE-SIZE-BYTES' in request parameters "
+                    f"defaulting to {DEFAULT_MAX_NVCF_MSG_SIZE}!"
+                )
+                max_response_size = DEFAULT_MAX_NVCF_MSG_SIZE
+            self._max_msg_size = int(max_response_size)
+        return self._max_msg_size
+
+
 def get_output_path(request_parameters: dict) -> str:
     """
     Gets the storage location (file path)
     to save a large generated output assets to be retrieved by the client (NVCF-LARGE-OUTPUT-DIR)
     from the function invocation message
     :param request_parameters: a dict of the parameters passed to the function
+        or a RequestContext
     :return: asset output path string
     """
-    request_parameters = _uppercase_dict_keys(request_parameters)
-    request_id = get_request_id(request_parameters)
-    output_path = request_parameters.get(
-        "NVCF-LARGE-OUTPUT-DIR", f"/var/inf/response/{request_id}"
-    )
-    return output_path
+    return RequestContext.from_request(request_parameters).output_path
 
 
 def get_input_path(request_parameters: dict) -> str:
@@ -179,14 +1477,10 @@ def get_input_path(request_parameters: dict) -> str:
     Gets the storage location (file path) where large input assets sent to the function (NVCF-ASSET-DIR)
     from the function invocation message
     :param request_parameters: a dict of the parameters passed to the function
+        or a RequestContext
     :return: asset input path string
     """
-    request_parameters = _uppercase_dict_keys(request_parameters)
-    request_id = get_request_id(request_parameters)
-    input_assets_path_base = request_parameters.get(
-        "NVCF-ASSET-DIR", f"/var/inf/inputAssets/{request_id}"
-    )
-    return input_assets_path_base
+    return RequestContext.from_request(request_parameters).input_path
 
 
 def get_max_msg_size(request_parameters: dict) -> int:
@@ -195,81 +1489,70 @@ def get_max_msg_size(request_parameters: dict) -> int:
     that can be returned as part of an HTTP response of the function (NVCF-MAX-RESPONSE-SIZE-BYTES)
     from the function invocation message
     :param request_parameters: a dict of the parameters passed to the function
+        or a RequestContext
     :return: max returned bytes size in int
     """
-    request_parameters = _uppercase_dict_keys(request_parameters)
-    max_response_size = request_parameters.get("NVCF-MAX-RESPONSE-SIZE-BYTES")
-    if max_response_size is None:
-        l = get_logger()
-        l.warning(
-            "Could not find 'NVCF-MAX-RESPONSE-SIZE-BYTES' in request parameters "
-            f"defaulting to {DEFAULT_MAX_NVCF_MSG_SIZE}!"
-        )
-        max_response_size = DEFAULT_MAX_NVCF_MSG_SIZE
-
-    return int(max_response_size)
+    return RequestContext.from_request(request_parameters).max_msg_size
 
 
 def get_nca_id(request_parameters: dict) -> str:
     """
     Get the ncaId of the invocation (NVIDIA Cloud Account ID) from the function invocation message
     :param request_parameters: a dict of the parameters passed to the function
+        or a RequestContext
     :return: ncaId string
     """
-    request_parameters = _uppercase_dict_keys(request_parameters)
-    return request_parameters.get("NVCF-NCAID", "")
+    return RequestContext.from_request(request_parameters).nca_id
 
 
 def get_request_id(request_parameters: dict) -> str:
     """
     Get the reqId of the invocation (NVCF-REQID) from the function invocation message
     :param request_parameters: a dict of the parameters passed to the function
+        or a RequestContext
     :return: request id string
     """
-    request_parameters = _uppercase_dict_keys(request_parameters)
-    return request_parameters.get("NVCF-REQID", "")
+    return RequestContext.from_request(request_parameters).request_id
 
 
 def get_asset_ids(request_parameters: dict) -> list:
     """
     Get the asset_ids of the invocation (NVCF-FUNCTION-ASSET-IDS) from the function invocation message
     :param request_parameters: a dict of the parameters passed to the function
+        or a RequestContext
     :return: list of asset ids
     """
-    request_parameters = _uppercase_dict_keys(request_parameters)
-    s = request_parameters.get("NVCF-FUNCTION-ASSET-IDS", "")
-    ids = s.split(",")
-    return ids
+    return list(RequestContext.from_request(request_parameters).asset_ids)
 
 
 def get_properties_sub(request_parameters: dict) -> str:
     """
     Get the sub properties of the invocation of the invocation (NVCF-SUB) from the function invocation message
     :param request_parameters: a dict of the parameters passed to the function
+        or a RequestContext
     :return: sub properties string
     """
-    request_parameters = _uppercase_dict_keys(request_parameters)
-    return request_parameters.get("NVCF-SUB", "")
+    return RequestContext.from_request(request_parameters).properties_sub
 
 
 def get_function_id(request_parameters: dict) -> str:
     """
     Get the function ID of the invocation (NVCF-FUNCTION-ID) from the function invocation message
-    :param request_parameters: a dict of the parameters passed to a function
+    :param request_parameters: a dict of the parameters passed to a function or
+        a RequestContext
     :return: function ID str
     """
-    request_parameters = _uppercase_dict_keys(request_parameters)
-    return request_parameters.get("NVCF-FUNCTION-ID", "")
+    return RequestContext.from_request(request_parameters).function_id
 
 
 def get_function_name(request_parameters: dict) -> str:
     """
     Get the function name (NVCF-FUNCTION-NAME) from the function invocation message
-    :param request_parameters: a dict of the parameters passed to a function
+    :param request_parameters: a dict of the parameters passed to a function or
+        a RequestContext
     :return: function name string
     """
-    request_parameters = _uppercase_dict_keys(request_parameters)
-    return request_parameters.get("NVCF-FUNCTION-NAME", "")
+    return RequestContext.from_request(request_parameters).function_name
 
 
 def get_config_value(value_name: str, model_config: dict = None) -> str:
@@ -284,150 +1567,1210 @@ def get_config_value(value_name: str, model_config: dict = None) -> str:
         )
 
 
-def load_npz(input_str: str, root_dir: str, array_name: str):
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+_duration_pattern = re.compile(r"^\s*([0-9]*\.?[0-9]+)\s*(ms|s|m|h)?\s*$")
+
+
+def _parse_bool(value: str) -> bool:
+    lowered = value.strip().lower()
+    if lowered in ("1", "true", "yes", "on"):
+        return True
+    if lowered in ("0", "false", "no", "off"):
+        return False
+    raise ValueError(f"{value!r} is not a boolean")
+
+
+def _parse_list(value: str) -> list:
+    value = value.strip()
+    if value.startswith("["):
+        return list(json.loads(value))
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+def _parse_duration(value: str) -> float:
+    match = _duration_pattern.match(value)
+    if match is None:
+        raise ValueError(
+            f"{value!r} is not a duration, expected e.g. 500ms, 30s, 5m or 1h"
+        )
+    return float(match.group(1)) * _DURATION_UNITS[match.group(2) or "s"]
+
+
+_CONFIG_PARSERS = {
+    str: str,
+    int: int,
+    float: float,
+    bool: _parse_bool,
+    list: _parse_list,
+    "duration": _parse_duration,
+}
+
+_REQUIRED = object()
+
+ConfigOption = namedtuple(
+    "ConfigOption",
+    ["type", "default", "validator"],
+    defaults=(str, _REQUIRED, None),
+)
+ConfigOption.__doc__ = """
+A typed configuration value for ConfigResolver
+:param type: str, int, float, bool, list (comma separated or a JSON list) or
+    "duration" (500ms, 30s, 5m, 1h -> seconds)
+:param default: value used when neither the environment nor the model config set
+    it, required if omitted
+:param validator: optional function returning False for invalid values
+"""
+
+
+class ConfigResolver:
+    """
+    Resolves typed configuration values once, from environment variables or
+    Triton's model config with the priority given to the environment (like
+    get_config_value), and exposes them as attributes.
+    Values are parsed and validated when the resolver is created or reloaded,
+    not on every access.
+
+    Example Usage:
+        class TritonPythonModel:
+            def initialize(self, args):
+                self.config = ConfigResolver(
+                    {
+                        "MAX_BATCH_SIZE": ConfigOption(int, 8, lambda v: v > 0),
+                        "THRESHOLD": ConfigOption(float, 0.5),
+                        "USE_FP16": ConfigOption(bool, False),
+                        "LABELS": ConfigOption(list, []),
+                        "TIMEOUT": ConfigOption("duration", 30.0),
+                        "MODEL_NAME": ConfigOption(str),
+                    },
+                    json.loads(args["model_config"]),
+                )
+
+            def execute(self, requests):
+                if len(requests) > self.config.MAX_BATCH_SIZE:
+                    ...
+    """
+
+    def __init__(self, options: dict, model_config: dict = None):
+        """
+        :param options: dict of value name to ConfigOption, a type or a (type,
+            default) tuple
+        :param model_config: Triton's model config
+        """
+        self._options = {
+            name: _to_config_option(option) for name, option in options.items()
+        }
+        self._model_config = model_config
+        self._values = {}
+        self.reload()
+
+    def __getitem__(self, name: str):
+        return self._values[name]
+
+    def __repr__(self) -> str:
+        return f"ConfigResolver({self._values!r})"
+
+    def as_dict(self) -> dict:
+        """
+        :return: a copy of all resolved values
+        """
+        return dict(self._values)
+
+    def reload(self, model_config: dict = None):
+        """
+        Reads the environment and the model config again and re-validates every
+        value
+        :param model_config: a new model config, defaults to the one given
+            before
+        """
+        if model_config is not None:
+            self._model_config = model_config
+        parameters = (self._model_config or {}).get("parameters", {})
+
+        values = {}
+        errors = []
+        for name, option in self._options.items():
+            raw = os.environ.get(name)
+            if raw is None and name in parameters:
+                raw = parameters[name]["string_value"]
+            if raw is None:
+                if option.default is _REQUIRED:
+                    errors.append(f"{name} is not set")
+                else:
+                    values[name] = option.default
+                continue
+            try:
+                value = _CONFIG_PARSERS[option.type](raw)
+            except (ValueError, TypeError) as e:
+                type_name = getattr(option.type, "__name__", option.type)
+                errors.append(f"{name}={raw!r} is not a valid {type_name}: {e}")
+                continue
+            if option.validator is not None and not option.validator(value):
+                errors.append(f"{name}={raw!r} failed validation")
+                continue
+            values[name] = value
+        if errors:
+            raise ValueError(f"Invalid configuration: {'; '.join(errors)}")
+
+        for name in self._values:
+            self.__dict__.pop(name, None)
+        self._values = values
+        # plain instance attributes make every later access a dict lookup
+        for name, value in values.items():
+            if name.isidentifier() and not hasattr(type(self), name):
+                self.__dict__[name] = value
+
+
+def _to_config_option(option) -> ConfigOption:
+    if isinstance(option, ConfigOption):
+        result = option
+    elif isinstance(option, tuple):
+        result = ConfigOption(*option)
+    else:
+        result = ConfigOption(option)
+    if result.type not in _CONFIG_PARSERS:
+        raise ValueError(
+            f"Unexpected config type {result.type}, expected one of "
+            f"str, int, float, bool, list or 'duration'"
+        )
+    return result
+
+
+_npz_cache = OrderedDict()
+_npz_cache_lock = threading.Lock()
+
+
+def _npz_extract_dir() -> str:
+    # gettempdir() probes the filesystem, so it is not called at import time
+    if NPZ_EXTRACT_DIR is not None:
+        return NPZ_EXTRACT_DIR
+    return os.path.join(tempfile.gettempdir(), "nvcf_npz_cache")
+
+
+def _extract_npz_member(
+    path: str, stat: os.stat_result, member: str, extract_dir: str
+) -> str:
+    """
+    Extracts one .npy member of an npz archive to extract_dir once, so it can be
+    memory-mapped.
+    Extractions are stored per archive path, in one directory per archive mtime
+    and size: a modified archive is extracted again and the extractions of its
+    previous versions are removed.
+    :return: path of the extracted .npy file
     """
-    Loads an nzp from a path
-    :param input_str: path to npz
+    archive_dir = os.path.join(
+        extract_dir, hashlib.sha1(os.path.abspath(path).encode()).hexdigest()
+    )
+    version = f"{stat.st_mtime_ns}-{stat.st_size}"
+    target = os.path.join(archive_dir, version, member)
+    if not os.path.exists(target):
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with zipfile.ZipFile(path) as archive:
+            with archive.open(member) as src:
+                _write_file_atomic(target, src)
+        for name in os.listdir(archive_dir):
+            if name != version:
+                # arrays already memory-mapped from there stay readable on POSIX
+                shutil.rmtree(
+                    os.path.join(archive_dir, name), ignore_errors=True
+                )
+    return target
+
+
+def _read_npz(
+    path: str,
+    stat: os.stat_result,
+    array_name: str,
+    mmap_mode: str,
+    extract_dir: str,
+):
+    import numpy as np
+
+    if path.endswith(".npy"):
+        return np.load(path, mmap_mode=mmap_mode)
+    if mmap_mode is not None:
+        member = _extract_npz_member(
+            path, stat, f"{array_name}.npy", extract_dir or _npz_extract_dir()
+        )
+        return np.load(member, mmap_mode=mmap_mode)
+    with np.load(path) as data:
+        return data[array_name]
+
+
+def load_npz(
+    input_str: str,
+    root_dir: str,
+    array_name: str = None,
+    mmap_mode: str = None,
+    cache: bool = False,
+    extract_dir: str = None,
+):
+    """
+    Loads an array from an npz (or npy) from a path
+    :param input_str: path to npz or npy
     :param root_dir: directory where asset are saved
+    :param array_name: name of the array in the npz, not used for npy files
+    :param mmap_mode: e.g. "r" to memory-map the array instead of reading it.
+        npz members are extracted once to extract_dir and memory-mapped from
+        there
+    :param cache: keep the array in an in-process LRU cache keyed by path and
+        mtime, cached arrays are read-only and shared between calls
+    :param extract_dir: directory for extracted npz members, defaults to
+        NPZ_EXTRACT_DIR or else nvcf_npz_cache in the temporary directory
     :return: a numpy array
     """
-    if os.path.exists(os.path.join(root_dir, input_str)):
-        try:
-            data = np.load(os.path.join(root_dir, input_str))
-            return data[array_name]
-        except Exception as e:
+    path = os.path.join(root_dir, input_str)
+    try:
+        stat = os.stat(path)
+    except (OSError, ValueError):
+        raise Exception(f"Unsure what {_abbreviate(input_str)} is!")
+
+    key = (path, array_name, mmap_mode)
+    if cache:
+        with _npz_cache_lock:
+            entry = _npz_cache.get(key)
+            if entry is not None and entry[0] == (
+                stat.st_mtime_ns,
+                stat.st_size,
+            ):
+                _npz_cache.move_to_end(key)
+                return entry[1]
+
+    try:
+        array = _read_npz(path, stat, array_name, mmap_mode, extract_dir)
+    except Exception as e:
+        raise Exception(f"{input_str} was not a file path of an npz file. {e}")
+
+    if cache:
+        array.flags.writeable = False
+        with _npz_cache_lock:
+            _npz_cache[key] = ((stat.st_mtime_ns, stat.st_size), array)
+            _npz_cache.move_to_end(key)
+            while len(_npz_cache) > NPZ_CACHE_SIZE:
+                _npz_cache.popitem(last=False)
+    return array
+
+
+def _abbreviate(input_str: str, limit: int = 64) -> str:
+    """
+    Shortens a possibly multi-megabyte input for use in error messages
+    """
+    if len(input_str) <= limit:
+        return input_str
+    return f"{input_str[:limit]}... ({len(input_str)} characters)"
+
+
+def _classify_image_input(input_str: str, root_dir: str) -> tuple:
+    """
+    Decides whether an input is a path under root_dir or inline base64 data
+    without scanning the whole string: data URIs are recognized by their header
+    and only inputs short enough to be a path are probed on the filesystem.
+    :param input_str: b64 string, base64 data URI or path to a file
+    :param root_dir: directory where assets are saved
+    :return: ("path", full path) or ("base64", base64 payload)
+    """
+    if input_str.startswith("data:"):
+        header, sep, payload = input_str.partition(",")
+        if not sep or not header.endswith(";base64"):
             raise Exception(
-                f"{input_str} was not a file path of an npz file. {e}"
+                f"{_abbreviate(input_str)} is not a base64 encoded data URI!"
+            )
+        return "base64", payload
+
+    if len(input_str) <= MAX_PATH_LENGTH:
+        path = os.path.join(root_dir, input_str)
+        if os.path.exists(path):
+            return "path", path
+
+    return "base64", input_str
+
+
+def _prepare_image(
+    i: "Image",
+    has_transparency: bool = False,
+    target_size: tuple = None,
+    max_side: int = None,
+):
+    """
+    Converts a freshly opened (not yet loaded) PIL Image to RGB/RGBA and
+    optionally downsizes it.
+    JPEGs are decoded directly at 1/2, 1/4 or 1/8 scale using PIL's draft mode,
+    then a single resize brings the image to the requested size.
+    :param i: an opened PIL Image
+    :param has_transparency: if the alpha channel should be kept.
+    :param target_size: optional (width, height) the image is resized to
+    :param max_side: optional maximum length of the longest side, keeps the
+        aspect ratio
+    :return: a PIL Image
+    """
+    mode = "RGBA" if has_transparency else "RGB"
+    if target_size is None and max_side is not None:
+        width, height = i.size
+        scale = max_side / max(width, height)
+        if scale < 1:
+            target_size = (
+                max(1, round(width * scale)),
+                max(1, round(height * scale)),
             )
+    if target_size is not None:
+        target_size = tuple(target_size)
+        # no-op for formats other than JPEG, never goes below target_size
+        i.draft("RGB" if mode == "RGB" else None, target_size)
+
+    if i.mode != mode:
+        i = i.convert(mode)
     else:
-        raise Exception(f"Unsure what {input_str} is!")
+        i.load()
 
+    if target_size is not None and i.size != target_size:
+        from PIL import Image
 
-def load_image(input_str: str, root_dir: str, has_transparency: bool = False):
+        i = i.resize(target_size, Image.BICUBIC)
+    return i
+
+
+def _decoded_image_size(args, kwargs, image) -> int:
+    return image.width * image.height * len(image.getbands())
+
+
+@instrument("decode_image", size=_decoded_image_size)
+def load_image(
+    input_str: str,
+    root_dir: str,
+    has_transparency: bool = False,
+    target_size: tuple = None,
+    max_side: int = None,
+):
     """
-    Loads an image from a b64 string or from a path
+    Loads an image from a b64 string, a base64 data URI or from a path
     :param input_str: b64 string or path to image
     :param root_dir: directory where images are saved
     :param has_transparency: if the alpha channel should be kept.
+    :param target_size: optional (width, height), JPEGs are decoded at reduced
+        scale when possible
+    :param max_side: optional maximum length of the longest side, keeps the
+        aspect ratio
     :return: a PIL Image
     """
-    if os.path.exists(os.path.join(root_dir, input_str)):
+    from PIL import Image
+
+    kind, value = _classify_image_input(input_str, root_dir)
+    if kind == "path":
         # image exists in path
         try:
-            i = Image.open(os.path.join(root_dir, input_str))
+            i = Image.open(value)
         except Exception as e:
             raise Exception(f"{input_str} was not a file path of an image. {e}")
-    elif b64_pattern.match(input_str):
-        # image might be a b64 string
+    else:
+        # image might be a b64 string, validated while it is decoded
         try:
-            i = Image.open(
-                io.BytesIO(base64.decodebytes(bytes(input_str, "utf-8")))
-            )
+            raw_bytes = decode_base64_str_to_bytes(value, validate=True)
+        except ValueError:  # binascii.Error and non-ASCII input
+            raise Exception(f"Unsure what {_abbreviate(input_str)} is!")
+        try:
+            i = Image.open(raw_bytes)
         except Exception as e:
             raise Exception(
-                f"{input_str} was not a b64 encoded image string. {e}"
+                f"{_abbreviate(input_str)} was not a b64 encoded image "
+                f"string. {e}"
             )
-    else:
-        raise Exception(f"Unsure what {input_str} is!")
 
-    if has_transparency:
-        return i.convert("RGBA")
-    else:
-        return i.convert("RGB")
+    return _prepare_image(i, has_transparency, target_size, max_side)
 
 
 def encode_bytes_base64_to_str(b: bytes) -> bytes:
     return base64.b64encode(b)
 
 
+def _iter_chunks(source, chunk_size: int):
+    """
+    Yields byte chunks of at most chunk_size from a str, a bytes-like object,
+    a file-like object (anything with read) or an iterable of bytes/str chunks.
+    Bytes-like sources are sliced through a memoryview so nothing is copied.
+    """
+    if isinstance(source, str):
+        for start in range(0, len(source), chunk_size):
+            yield source[start : start + chunk_size].encode("ascii")
+    elif isinstance(source, (bytes, bytearray, memoryview)):
+        view = memoryview(source).cast("B")
+        for start in range(0, len(view), chunk_size):
+            yield view[start : start + chunk_size]
+    elif hasattr(source, "read"):
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                break
+            if isinstance(chunk, str):
+                chunk = chunk.encode("ascii")
+            yield chunk
+    else:
+        for chunk in source:
+            if isinstance(chunk, str):
+                chunk = chunk.encode("ascii")
+            yield chunk
+
+
+def iter_base64_encode(source, chunk_size: int = BASE64_CHUNK_SIZE):
+    """
+    Base64 encodes a stream chunk by chunk without materializing the whole
+    encoded string
+    :param source: bytes-like object, file-like object opened in binary mode or
+        an iterable of bytes
+    :param chunk_size: number of raw bytes encoded per chunk, must be a multiple
+        of 3
+    :return: a generator of base64 encoded bytes chunks
+    """
+    if chunk_size <= 0 or chunk_size % 3:
+        raise ValueError(
+            f"chunk_size must be a multiple of 3, got {chunk_size}"
+        )
+
+    remainder = b""
+    for chunk in _iter_chunks(source, chunk_size):
+        if remainder:
+            chunk = remainder + chunk
+        aligned = len(chunk) - len(chunk) % 3
+        if aligned:
+            yield binascii.b2a_base64(chunk[:aligned], newline=False)
+        remainder = bytes(chunk[aligned:])
+    if remainder:
+        yield binascii.b2a_base64(remainder, newline=False)
+
+
+def iter_base64_decode(
+    source,
+    chunk_size: int = BASE64_CHUNK_SIZE // 3 * 4,
+    validate: bool = False,
+):
+    """
+    Decodes a base64 stream chunk by chunk without materializing the whole
+    decoded payload.
+    :param source: base64 str, bytes-like object, file-like object or an
+        iterable of str/bytes
+    :param chunk_size: number of base64 characters decoded per chunk, must be a
+        multiple of 4
+    :param validate: if True any character outside the base64 alphabet or
+        misplaced padding raises binascii.Error, otherwise whitespace and
+        newlines are ignored
+    :return: a generator of decoded bytes chunks
+    """
+    if chunk_size <= 0 or chunk_size % 4:
+        raise ValueError(
+            f"chunk_size must be a multiple of 4, got {chunk_size}"
+        )
+
+    a2b_base64 = _a2b_base64_strict if validate else binascii.a2b_base64
+    remainder = b""
+    for chunk in _iter_chunks(source, chunk_size):
+        if not validate:
+            chunk = bytes(chunk).translate(None, b" \t\r\n")
+        if remainder:
+            chunk = remainder + chunk
+        aligned = len(chunk) - len(chunk) % 4
+        if aligned:
+            yield a2b_base64(memoryview(chunk)[:aligned])
+        remainder = bytes(chunk[aligned:])
+    if remainder:
+        raise binascii.Error("Incorrect padding")
+
+
+def encode_base64_stream(
+    source, destination, chunk_size: int = BASE64_CHUNK_SIZE
+) -> int:
+    """
+    Base64 encodes source into destination chunk by chunk,
+    e.g. from an image file into an open output file or socket
+    :param source: bytes-like object, file-like object opened in binary mode or
+        an iterable of bytes
+    :param destination: a file-like object opened in binary mode
+    :param chunk_size: number of raw bytes encoded per chunk, must be a multiple
+        of 3
+    :return: number of base64 bytes written
+    """
+    written = 0
+    for chunk in iter_base64_encode(source, chunk_size):
+        destination.write(chunk)
+        written += len(chunk)
+    return written
+
+
+def decode_base64_stream(
+    source,
+    destination,
+    chunk_size: int = BASE64_CHUNK_SIZE // 3 * 4,
+    validate: bool = False,
+) -> int:
+    """
+    Decodes a base64 source into destination chunk by chunk
+    :param source: base64 str, bytes-like object, file-like object or an
+        iterable of str/bytes
+    :param destination: a file-like object opened in binary mode
+    :param chunk_size: number of base64 characters decoded per chunk, must be a
+        multiple of 4
+    :param validate: if True reject input that is not strictly base64
+    :return: number of decoded bytes written
+    """
+    written = 0
+    for chunk in iter_base64_decode(source, chunk_size, validate):
+        destination.write(chunk)
+        written += len(chunk)
+    return written
+
+
+def get_encoding_options(
+    image_format: str, image_quality: int = IMAGE_QUALITY, profile: str = None
+) -> dict:
+    """
+    Gets the keyword arguments passed to PIL's Image.save for an encoding
+    profile
+    :param image_format: the PIL image format, e.g. JPEG, PNG or WEBP
+    :param image_quality: quality used for lossy formats
+    :param profile: one of ENCODING_PROFILES, defaults to the
+        NVCF_IMAGE_ENCODING_PROFILE environment variable and then to
+        DEFAULT_ENCODING_PROFILE. WEBP only uses image_quality when a profile is
+        chosen, otherwise it keeps PIL's default (80)
+    :return: a dict of Image.save options
+    """
+    if profile is None:
+        profile = os.environ.get(ENCODING_PROFILE_ENV)
+    # WEBP was always saved with PIL's default quality before the profiles
+    quality_formats = _QUALITY_FORMATS if profile else ("JPEG",)
+    if not profile:
+        profile = DEFAULT_ENCODING_PROFILE
+    try:
+        options = ENCODING_PROFILES[profile]
+    except KeyError:
+        raise ValueError(
+            f"Unexpected encoding profile {profile}. "
+            f"Expected one of {', '.join(ENCODING_PROFILES)}!"
+        )
+    image_format = image_format.upper()
+    options = dict(options.get(image_format, {}))
+    if image_format in quality_formats:
+        options["quality"] = image_quality
+    return options
+
+
+@instrument("encode_image", size=lambda args, kwargs, buffer: buffer.tell())
+def _save_image_to_buffer(
+    image: "Image",
+    image_format: str = "JPEG",
+    image_quality: int = IMAGE_QUALITY,
+    profile: str = None,
+) -> io.BytesIO:
+    """
+    Encodes a PIL Image into an in-memory buffer
+    """
+    raw_bytes = io.BytesIO()
+    image.save(
+        raw_bytes,
+        image_format,
+        **get_encoding_options(image_format, image_quality, profile),
+    )
+    return raw_bytes
+
+
 def encode_image_to_base64(
-    image: Image, image_format: str = "JPEG", image_quality: int = IMAGE_QUALITY
+    image: "Image",
+    image_format: str = "JPEG",
+    image_quality: int = IMAGE_QUALITY,
+    profile: str = None,
 ):
     """
     accepts an PIL Image and returns a base64 encoded representation of image
+    :param profile: encoding profile, see get_encoding_options
     """
-    raw_bytes = io.BytesIO()
-    if image_format == "JPEG":
-        image.save(
-            raw_bytes, image_format, quality=image_quality, optimize=True
-        )
-    elif image_format == "PNG":
-        image.save(raw_bytes, image_format, optimize=True)
+    raw_bytes = _save_image_to_buffer(
+        image, image_format, image_quality, profile
+    )
+    # encode straight from the buffer instead of copying it out with read()
+    return encode_bytes_base64_to_str(raw_bytes.getbuffer())
+
+
+def _timed_encode_image(
+    image: "Image", image_format: str, image_quality: int, profile: str
+):
+    """
+    Encodes one image and measures it, a module level function so it can run in
+    a process pool
+    :return: tuple of the base64 encoded image and the encoding time in seconds
+    """
+    start = time.perf_counter()
+    encoded = encode_image_to_base64(
+        image, image_format, image_quality, profile
+    )
+    return encoded, time.perf_counter() - start
+
+
+def encode_images_to_base64(
+    images: list,
+    image_format: str = "JPEG",
+    image_quality: int = IMAGE_QUALITY,
+    max_workers: int = None,
+    use_processes: bool = False,
+    executor=None,
+    return_timings: bool = False,
+    profile: str = None,
+):
+    """
+    accepts a list of PIL Images and returns their base64 encoded
+    representations in the same order.
+    Images are encoded concurrently on a thread pool, PIL releases the GIL while
+    encoding.
+    :param images: list of PIL Images
+    :param image_format: format passed to encode_image_to_base64
+    :param image_quality: quality passed to encode_image_to_base64
+    :param max_workers: pool size, defaults to the number of CPUs
+    :param use_processes: use a process pool instead of threads, images are
+        pickled to the workers
+    :param executor: an existing concurrent.futures executor to reuse instead of
+        creating a pool
+    :param return_timings: also return the encoding time of each image in
+        seconds
+    :param profile: encoding profile, see get_encoding_options
+    :return: list of base64 encoded images, or a tuple (encoded images, timings)
+        if return_timings
+
+    Example Usage:
+        encoded, timings = encode_images_to_base64(images, return_timings=True)
+    """
+    images = list(images)
+    n = len(images)
+    if profile is None:
+        # resolve once so process pool workers do not depend on their
+        # environment
+        profile = os.environ.get(ENCODING_PROFILE_ENV, DEFAULT_ENCODING_PROFILE)
+    args = (images, [image_format] * n, [image_quality] * n, [profile] * n)
+
+    if executor is not None:
+        results = list(executor.map(_timed_encode_image, *args))
+    elif n <= 1:
+        results = list(map(_timed_encode_image, *args))
     else:
-        image.save(raw_bytes, image_format)
-    raw_bytes.seek(0)  # return to the start of the buffer
-    return encode_bytes_base64_to_str(raw_bytes.read())
+        if max_workers is None:
+            max_workers = os.cpu_count() or 1
+        max_workers = max(1, min(max_workers, n))
+        if use_processes:
+            from concurrent.futures import ProcessPoolExecutor as pool_class
+        else:
+            pool_class = ThreadPoolExecutor
+        with pool_class(max_workers=max_workers) as pool:
+            results = list(pool.map(_timed_encode_image, *args))
+
+    encoded = [r[0] for r in results]
+    if return_timings:
+        return encoded, [r[1] for r in results]
+    return encoded
+
+
+def iter_image_base64(
+    image: "Image",
+    image_format: str = "JPEG",
+    image_quality: int = IMAGE_QUALITY,
+    chunk_size: int = BASE64_CHUNK_SIZE,
+    profile: str = None,
+):
+    """
+    accepts an PIL Image and yields its base64 encoded representation in chunks,
+    suitable as the body of a streaming HTTP/SSE response
+
+    Example Usage:
+        return StreamingResponse(
+            iter_image_base64(image), media_type="text/plain"
+        )
+    """
+    raw_bytes = _save_image_to_buffer(
+        image, image_format, image_quality, profile
+    )
+    yield from iter_base64_encode(raw_bytes.getbuffer(), chunk_size)
 
 
-def decode_base64_str_to_bytes(base64_str: str):
-    return io.BytesIO(base64.decodebytes(base64_str))
+def decode_base64_str_to_bytes(base64_str: str, validate: bool = False):
+    """
+    Decodes an in-memory base64 str or bytes in one pass, the returned buffer
+    shares the decoded bytes without copying them. Use decode_base64_stream for
+    file-like or iterable sources.
+    :param base64_str: base64 encoded str or bytes
+    :param validate: if True reject input that is not strictly base64
+    :return: io.BytesIO positioned at the start of the decoded payload
+    """
+    if validate:
+        return io.BytesIO(_a2b_base64_strict(base64_str))
+    return io.BytesIO(binascii.a2b_base64(base64_str))
 
 
-def decode_base64_to_image(base64_str: str, has_transparency: bool = False):
+@instrument("decode_image", size=_decoded_image_size)
+def decode_base64_to_image(
+    base64_str: str,
+    has_transparency: bool = False,
+    target_size: tuple = None,
+    max_side: int = None,
+):
     """
     accepts base64 encoded representation of image and returns PIL Image
     :param base64_str: a string of image file bytes encoded in base64
     :param has_transparency: if the alpha channel should be kept.
+    :param target_size: optional (width, height), JPEGs are decoded at reduced
+        scale when possible
+    :param max_side: optional maximum length of the longest side, keeps the
+        aspect ratio
     :return: a PIL Image
     """
+    from PIL import Image
+
     i = Image.open(decode_base64_str_to_bytes(base64_str))
-    if has_transparency:
-        return i.convert("RGBA")
-    else:
-        return i.convert("RGB")
+    return _prepare_image(i, has_transparency, target_size, max_side)
+
+
+def _image_extension(image_format: str) -> str:
+    if image_format == "JPEG":
+        return "jpg"
+    elif image_format == "PNG":
+        return "png"
+    elif image_format == "WEBP":
+        return "webp"
+    raise ValueError(
+        f"Unexpected image format {image_format}. "
+        "Currently only JPEG, PNG or WEBP is supported!"
+    )
 
 
 def save_image_with_directory(
-    image: Image,
+    image: "Image",
     path: str = "",
     image_format: str = "JPEG",
     image_quality: int = IMAGE_QUALITY,
+    profile: str = None,
+    fsync: str = "never",
 ):
     """
     Saves an image at the specified path, creating any directories that do not exist.
+    The image is encoded in memory and written through a temporary file and an
+    atomic rename, so readers never see a partially written image. Use
+    ImageWriter to save in the background.
+    :param profile: encoding profile, see get_encoding_options
+    :param fsync: "never", "file" or "always", see ImageWriter
+    :return: path of the saved image
     """
-    # Make sure the directory and parent directories exist
-    directory = os.path.dirname(path)
-    if not os.path.exists(directory):
-        os.makedirs(directory)
+    extension = _image_extension(image_format)
+    # exist_ok, two threads may create the same directory
+    if path:
+        os.makedirs(path, exist_ok=True)
 
-    if image_format == "JPEG":
-        extension = "jpg"
-    elif image_format == "PNG":
-        extension = "png"
-    else:
+    save_path = os.path.join(path, f"image.{extension}")
+    raw_bytes = _save_image_to_buffer(
+        image, image_format, image_quality, profile
+    )
+    _write_file_atomic(save_path, raw_bytes.getbuffer(), fsync)
+    return save_path
+
+
+class ImageWriter:
+    """
+    Saves images in the background on a thread pool, like
+    save_image_with_directory, so that a function producing many outputs does
+    not block on encoding and disk I/O.
+    The images must not be modified until their save completed.
+    Call flush() before returning the response so that every image is on disk.
+
+    Example Usage:
+        writer = get_image_writer()
+        for i, image in enumerate(images):
+            writer.save(
+                image, os.path.join(get_output_path(request_parameters), str(i))
+            )
+        writer.flush()
+    """
+
+    def __init__(
+        self, max_workers: int = IMAGE_WRITER_WORKERS, fsync: str = "never"
+    ):
+        """
+        :param max_workers: number of threads encoding and writing images
+        :param fsync: "never" (default) leaves flushing to the OS, "file" fsyncs
+            every image before renaming it into place, "always" also fsyncs the
+            directory so the rename survives a crash
+        """
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(
+                f"Unexpected fsync policy {fsync}, "
+                f"expected one of {FSYNC_POLICIES}"
+            )
+        self.fsync = fsync
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="nvcf-image-writer"
+        )
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def __enter__(self) -> "ImageWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def save(
+        self,
+        image: "Image",
+        path: str = "",
+        image_format: str = "JPEG",
+        image_quality: int = IMAGE_QUALITY,
+        profile: str = None,
+    ):
+        """
+        Schedules save_image_with_directory
+        :return: concurrent.futures.Future resolving to the path of the saved
+            image
+        """
+        _image_extension(image_format)  # fail fast on the caller's thread
+        future = self._executor.submit(
+            save_image_with_directory,
+            image,
+            path,
+            image_format,
+            image_quality,
+            profile,
+            self.fsync,
+        )
+        with self._lock:
+            self._pending.add(future)
+        future.add_done_callback(self._discard)
+        return future
+
+    def flush(self, timeout: float = None):
+        """
+        Waits until every image scheduled so far is saved, the paths are the
+        results of the futures returned by save()
+        :param timeout: maximum number of seconds to wait
+        :raises: the first exception raised by a save since the last flush,
+            concurrent.futures.TimeoutError on timeout
+        """
+        with self._lock:
+            pending = list(self._pending)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        error = None
+        for future in pending:
+            remaining = (
+                None
+                if deadline is None
+                else max(0, deadline - time.monotonic())
+            )
+            try:
+                future.result(remaining)
+            except FutureTimeoutError:
+                raise
+            except Exception as e:
+                error = error or e
+            with self._lock:
+                self._pending.discard(future)
+        if error is not None:
+            raise error
+
+    def close(self):
+        """
+        Waits for the pending saves and stops the threads
+        """
+        self._executor.shutdown(wait=True)
+
+    def _discard(self, future):
+        # failed saves are kept until flush() reports them
+        if future.cancelled() or future.exception() is None:
+            with self._lock:
+                self._pending.discard(future)
+
+
+_image_writer = None
+_image_writer_lock = threading.Lock()
+
+
+def get_image_writer() -> ImageWriter:
+    """
+    Gets the process-wide ImageWriter, created on first use
+    :return: ImageWriter
+    """
+    global _image_writer
+
+    if _image_writer is None:
+        with _image_writer_lock:
+            if _image_writer is None:
+                _image_writer = ImageWriter()
+    return _image_writer
+
+
+def base64_encoded_size(n_bytes: int) -> int:
+    """
+    Size in bytes of the base64 encoding of n_bytes bytes, without encoding
+    anything
+    """
+    return 4 * ((n_bytes + 2) // 3)
+
+
+def _payload_size(payload) -> int:
+    """
+    Size in bytes of a bytes-like object or of the rest of a seekable file
+    object
+    """
+    if hasattr(payload, "read"):
+        position = payload.tell()
+        size = payload.seek(0, io.SEEK_END) - position
+        payload.seek(position)
+        return size
+    with memoryview(payload) as view:
+        return view.nbytes
+
+
+_manifest_lock = threading.Lock()
+
+
+def _write_large_output(
+    output_path: str, filename: str, payload, size: int, content_type: str
+) -> str:
+    """
+    Streams payload into output_path/filename through a temporary file and an
+    atomic rename, then adds the file to the manifest of the output directory
+    :return: path of the written file
+    """
+    # the name must not escape output_path
+    if filename in ("", ".", "..") or os.path.basename(filename) != filename:
         raise ValueError(
-            "Unexpected image format {}. Currently only JPEG or PNG is supported!"
+            f"Invalid large output file name {filename!r}, "
+            "expected a file name without directories"
         )
+    os.makedirs(output_path, exist_ok=True)
+    path = os.path.join(output_path, filename)
+    _write_file_atomic(path, payload)
 
-    save_path = os.path.join(path, f"image.{extension}")
-    if image_format == "JPEG":
-        image.save(
-            save_path, image_format, quality=image_quality, optimize=True
+    manifest_path = os.path.join(output_path, LARGE_OUTPUT_MANIFEST)
+    with _manifest_lock:
+        try:
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            manifest = {"files": []}
+        manifest["files"] = [
+            entry for entry in manifest["files"] if entry["name"] != filename
+        ]
+        manifest["files"].append(
+            {"name": filename, "size": size, "content_type": content_type}
         )
-    else:
-        image.save(save_path, image_format)
-    return save_path
+        _write_file_atomic(manifest_path, json.dumps(manifest))
+    return path
+
+
+def route_response(
+    request_parameters: dict,
+    payload,
+    filename: str,
+    content_type: str = "application/octet-stream",
+    overhead: int = 0,
+) -> dict:
+    """
+    Returns a payload inline as base64 when it fits in the maximum response size
+    of the invocation
+    (NVCF-MAX-RESPONSE-SIZE-BYTES), otherwise streams the raw bytes into the
+    large output directory (NVCF-LARGE-OUTPUT-DIR) without ever building the
+    base64 string.
+    The base64 size is computed from the payload size before anything is
+    encoded.
+    Large outputs are written atomically and listed in the manifest.json of the
+    directory.
+    :param request_parameters: a dict of the parameters passed to the function
+        or a RequestContext
+    :param payload: bytes-like object or a seekable file object opened in binary
+        mode
+    :param filename: name of the file in the large output directory, without
+        directories
+    :param content_type: content type recorded in the manifest
+    :param overhead: size of the rest of the response, e.g. the surrounding JSON
+    :return: {"inline": True, "data": base64 str} or {"inline": False, "path":
+        file path, "size": bytes}
+
+    Example Usage:
+        result = route_response(
+            request.headers, video_bytes, "video.mp4", "video/mp4"
+        )
+        if result["inline"]:
+            return {"video": result["data"]}
+        return {"video": "large output"}
+    """
+    ctx = RequestContext.from_request(request_parameters)
+    size = _payload_size(payload)
+    if base64_encoded_size(size) + overhead <= ctx.max_msg_size:
+        if hasattr(payload, "read"):
+            payload = payload.read()
+        return {
+            "inline": True,
+            "data": encode_bytes_base64_to_str(payload).decode("ascii"),
+        }
+
+    path = _write_large_output(
+        ctx.output_path, filename, payload, size, content_type
+    )
+    return {"inline": False, "path": path, "size": size}
+
+
+def route_image_response(
+    request_parameters: dict,
+    image: "Image",
+    filename: str = None,
+    image_format: str = "JPEG",
+    image_quality: int = IMAGE_QUALITY,
+    profile: str = None,
+    overhead: int = 0,
+) -> dict:
+    """
+    Encodes a PIL Image once and routes it with route_response: inline as base64
+    when it fits in the maximum response size, otherwise written to the large
+    output directory
+    :param filename: name of the file in the large output directory, defaults to
+        image.jpg/png/webp
+    :return: {"inline": True, "data": base64 str} or {"inline": False, "path":
+        file path, "size": bytes}
+    """
+    from PIL import Image
+
+    raw_bytes = _save_image_to_buffer(
+        image, image_format, image_quality, profile
+    )
+    if filename is None:
+        extension = "jpg" if image_format == "JPEG" else image_format.lower()
+        filename = f"image.{extension}"
+    return route_response(
+        request_parameters,
+        raw_bytes.getbuffer(),
+        filename,
+        Image.MIME.get(image_format.upper(), "application/octet-stream"),
+        overhead,
+    )
+
+
+class SecretsStore:
+    """
+    Thread-safe, cached view of a secrets JSON file.
+    The file is parsed once and re-parsed only when an os.stat shows it was
+    replaced or modified
+    (mtime, size or inode changed, which covers Kubernetes secret volume
+    updates).
+    Lookups read the cached secrets without copying them.
+
+    Documentation:
+    https://docs.nvidia.com/cloud-functions/user-guide/latest/cloud-function/secrets.html
+
+    Example Usage:
+        store = get_secrets_store()
+        api_key = store.get("api-key")
+    """
+
+    def __init__(self, path: str = SECRETS_PATH):
+        """
+        Args:
+            path: location of the secrets JSON file
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        # (stamp, secrets) replaced as a whole so a lookup never pairs a stamp
+        # with other secrets
+        self._cached = None
+
+    def _current(self) -> types.MappingProxyType:
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            raise FileNotFoundError(f"Secrets file not found at {self.path}")
+        stamp = (st.st_mtime_ns, st.st_size, st.st_ino)
+        cached = self._cached
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+
+        with self._lock:
+            cached = self._cached
+            if cached is None or cached[0] != stamp:
+                try:
+                    with open(self.path, "r") as f:
+                        data = json.load(f)
+                except FileNotFoundError:
+                    raise FileNotFoundError(
+                        f"Secrets file not found at {self.path}"
+                    )
+                except json.JSONDecodeError as e:
+                    raise json.JSONDecodeError(
+                        f"Invalid JSON in secrets file: {str(e)}", e.doc, e.pos
+                    )
+                cached = (stamp, types.MappingProxyType(data))
+                self._cached = cached
+            return cached[1]
+
+    def secrets(self) -> types.MappingProxyType:
+        """
+        Returns:
+            a read-only mapping of all secrets, shared between callers
+
+        Raises:
+            FileNotFoundError: If the secrets file doesn't exist
+            json.JSONDecodeError: If the secrets file contains invalid JSON
+        """
+        return self._current()
+
+    def get(self, key: str, default=None):
+        """
+        Args:
+            key: name of the secret
+            default: value returned if the secret doesn't exist
+
+        Returns:
+            the secret value or default
+        """
+        return self._current().get(key, default)
+
+    def __getitem__(self, key: str):
+        return self._current()[key]
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._current()
+
+    def invalidate(self):
+        """
+        Forces the file to be parsed again on the next lookup
+        """
+        with self._lock:
+            self._cached = None
+
+
+_secrets_stores = {}
+_secrets_stores_lock = threading.Lock()
+
+
+def get_secrets_store(path: str = None) -> SecretsStore:
+    """
+    Gets the shared SecretsStore of a secrets file.
+
+    Args:
+        path: location of the secrets JSON file, defaults to SECRETS_PATH
+
+    Returns:
+        SecretsStore
+    """
+    if path is None:
+        path = SECRETS_PATH
+    store = _secrets_stores.get(path)
+    if store is None:
+        with _secrets_stores_lock:
+            store = _secrets_stores.setdefault(path, SecretsStore(path))
+    return store
 
 
 def get_secrets() -> dict:
     """
     Reads secrets from the secrets.json file located at /var/secrets/secrets.json.
     The secrets file should be a JSON file containing key-value pairs.
+    The file is only parsed again when it changes, see SecretsStore.
 
     Documentation: https://docs.nvidia.com/cloud-functions/user-guide/latest/cloud-function/secrets.html
-    
+
     Returns:
         dict: A dictionary containing the secrets
-        
+
     Raises:
         FileNotFoundError: If the secrets file doesn't exist
         json.JSONDecodeError: If the secrets file contains invalid JSON
     """
-    try:
-        with open(SECRETS_PATH, 'r') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        raise FileNotFoundError(f"Secrets file not found at {SECRETS_PATH}")
-    except json.JSONDecodeError as e:
-        raise json.JSONDecodeError(f"Invalid JSON in secrets file: {str(e)}", e.doc, e.pos)
+    return dict(get_secrets_store().secrets())
@@ -0,0 +1,227 @@
+import zlib
+import base64
+import binascii
+
+from .helpers import _a2b_base64_strict, _abbreviate
+
+NDARRAY_ALIGNMENT = 8  # bytes, arrays from decode_ndarrays are aligned to it
+
+_NDARRAY_COMPRESSIONS = ("zlib", "lzma")
+
+
+def _ndarray_header(array) -> str:
+    """
+    dtype;shape;order of an array, e.g. <f4;480x640x3;C
+    """
+    if array.dtype.hasobject or array.dtype.fields is not None:
+        raise ValueError(
+            f"Unsupported dtype {array.dtype}, "
+            "only arrays of fixed-size scalars can be encoded"
+        )
+    order = (
+        "F"
+        if array.flags.f_contiguous and not array.flags.c_contiguous
+        else "C"
+    )
+    shape = "x".join(str(d) for d in array.shape)
+    return f"{array.dtype.str};{shape};{order}"
+
+
+def _ndarray_buffer(array) -> memoryview:
+    """
+    The raw bytes of an array in the order of its header, without copying
+    contiguous arrays
+    """
+    import numpy as np
+
+    if array.flags.c_contiguous:
+        return memoryview(array.reshape(-1).view(np.uint8))
+    if array.flags.f_contiguous:
+        return memoryview(array.T.reshape(-1).view(np.uint8))
+    return memoryview(np.ascontiguousarray(array).reshape(-1).view(np.uint8))
+
+
+def _compress_ndarray_buffer(data, compression: str, compression_level: int):
+    if compression is None:
+        return data
+    if compression == "zlib":
+        return zlib.compress(
+            data, -1 if compression_level is None else compression_level
+        )
+    if compression == "lzma":
+        import lzma
+
+        return lzma.compress(
+            data, preset=6 if compression_level is None else compression_level
+        )
+    raise ValueError(
+        f"Unexpected compression {compression}, "
+        f"expected one of {_NDARRAY_COMPRESSIONS}"
+    )
+
+
+def _decompress_ndarray_buffer(data: bytes, compression: str) -> bytes:
+    if compression == "zlib":
+        return zlib.decompress(data)
+    if compression == "lzma":
+        import lzma
+
+        return lzma.decompress(data)
+    raise ValueError(
+        f"Unexpected compression {compression}, "
+        f"expected one of {_NDARRAY_COMPRESSIONS}"
+    )
+
+
+def _parse_ndarray(encoded, validate: bool, kind: str) -> tuple:
+    """
+    Splits an encoded array into its array headers and its decoded (and
+    decompressed) raw bytes
+    """
+    if isinstance(encoded, (bytes, bytearray, memoryview)):
+        encoded = bytes(encoded).decode("ascii")
+    prefix, separator, payload = encoded.partition(",")
+    options, _, headers = prefix.partition(":")
+    options = options.split(";")
+    if not separator or options[0] != kind or len(options) > 2:
+        raise ValueError(f"Unsure what {_abbreviate(encoded)} is!")
+    compression = options[1] if len(options) == 2 else None
+
+    data = (
+        _a2b_base64_strict(payload)
+        if validate
+        else binascii.a2b_base64(payload)
+    )
+    if compression is not None:
+        data = _decompress_ndarray_buffer(data, compression)
+    return headers, data
+
+
+def _frombuffer(data: bytes, header: str, offset: int = 0):
+    """
+    A read-only array viewing data at offset, as described by a
+    dtype;shape;order header
+    """
+    import numpy as np
+
+    try:
+        dtype, shape, order = header.split(";")
+        dtype = np.dtype(dtype)
+        shape = tuple(int(d) for d in shape.split("x")) if shape else ()
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid ndarray header {header}")
+    if order not in ("C", "F"):
+        raise ValueError(f"Invalid ndarray header {header}")
+
+    count = 1
+    for d in shape:
+        count *= d
+    if offset + count * dtype.itemsize > len(data):
+        raise ValueError(
+            f"Encoded ndarray {header} is truncated, "
+            f"got {len(data) - offset} bytes"
+        )
+    array = np.frombuffer(data, dtype, count, offset)
+    if order == "F":
+        return array.reshape(shape[::-1]).T
+    return array.reshape(shape)
+
+
+def encode_ndarray(
+    array, compression: str = None, compression_level: int = None
+) -> str:
+    """
+    Encodes a numpy array into a compact str that fits in a JSON request or
+    response, much smaller and faster than array.tolist(): a header with the
+    dtype, shape and memory order followed by the base64 of the raw buffer, e.g.
+    ndarray:<f4;480x640;C,AAAA... or ndarray;zlib:<f4;480x640;C,eJz... when
+    compressed. C and Fortran contiguous arrays are encoded without copying
+    their buffer.
+    :param array: numpy array of fixed-size scalars (numbers, bools, datetimes,
+        fixed-length strings)
+    :param compression: optional lossless compression of the buffer, "zlib" or
+        "lzma"
+    :param compression_level: zlib level 0-9 or lzma preset 0-9
+    :return: str, decoded with decode_ndarray
+
+    Example Usage:
+        response = {"embeddings": encode_ndarray(embeddings)}
+        ...
+        embeddings = decode_ndarray(response["embeddings"])
+    """
+    import numpy as np
+
+    array = np.asarray(array)
+    header = _ndarray_header(array)
+    data = _compress_ndarray_buffer(
+        _ndarray_buffer(array), compression, compression_level
+    )
+    kind = "ndarray" if compression is None else f"ndarray;{compression}"
+    payload = base64.b64encode(data).decode("ascii")
+    return f"{kind}:{header},{payload}"
+
+
+def decode_ndarray(encoded, validate: bool = False):
+    """
+    Decodes a str created by encode_ndarray. The array is a read-only view of
+    the decoded bytes, built with np.frombuffer without copying them, call
+    .copy() on it to modify it.
+    :param encoded: str (or ASCII bytes) created by encode_ndarray
+    :param validate: if True reject input that is not strictly base64
+    :return: numpy array with the dtype, shape and memory order of the encoded
+        array
+    """
+    header, data = _parse_ndarray(encoded, validate, "ndarray")
+    return _frombuffer(data, header)
+
+
+def encode_ndarrays(
+    arrays: list, compression: str = None, compression_level: int = None
+) -> str:
+    """
+    Encodes a list of numpy arrays into a single str like encode_ndarray, with
+    one header per array and one base64 (and compression) pass over all buffers,
+    e.g. ndarrays:<f4;2x3;C/<i8;;C,AAAA...
+    Each buffer is padded to a multiple of 8 bytes so the decoded arrays are
+    aligned.
+    :param arrays: list of numpy arrays, see encode_ndarray
+    :param compression: optional lossless compression of the buffers, "zlib" or
+        "lzma"
+    :param compression_level: zlib level 0-9 or lzma preset 0-9
+    :return: str, decoded with decode_ndarrays
+    """
+    import numpy as np
+
+    arrays = [np.asarray(a) for a in arrays]
+    headers = [_ndarray_header(a) for a in arrays]
+    parts = []
+    for array in arrays:
+        buffer = _ndarray_buffer(array)
+        parts.append(buffer)
+        padding = -len(buffer) % NDARRAY_ALIGNMENT
+        if padding:
+            parts.append(bytes(padding))
+    data = _compress_ndarray_buffer(
+        b"".join(parts), compression, compression_level
+    )
+    kind = "ndarrays" if compression is None else f"ndarrays;{compression}"
+    payload = base64.b64encode(data).decode("ascii")
+    return f"{kind}:{'/'.join(headers)},{payload}"
+
+
+def decode_ndarrays(encoded, validate: bool = False) -> list:
+    """
+    Decodes a str created by encode_ndarrays into read-only views of one decoded
+    buffer, see decode_ndarray
+    :param encoded: str (or ASCII bytes) created by encode_ndarrays
+    :param validate: if True reject input that is not strictly base64
+    :return: list of numpy arrays in the encoded order
+    """
+    headers, data = _parse_ndarray(encoded, validate, "ndarrays")
+    arrays = []
+    offset = 0
+    for header in headers.split("/") if headers else []:
+        array = _frombuffer(data, header, offset)
+        offset += array.nbytes + (-array.nbytes % NDARRAY_ALIGNMENT)
+        arrays.append(array)
+    return arrays
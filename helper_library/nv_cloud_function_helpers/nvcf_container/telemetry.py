@@ -0,0 +1,297 @@
+import time
+import functools
+import threading
+
+TELEMETRY_SCOPE = "nv_cloud_function_helpers"
+OPERATION_ATTRIBUTE = "nvcf.operation"
+REQUEST_ID_ATTRIBUTE = "nvcf.request_id"
+BYTES_ATTRIBUTE = "nvcf.bytes"
+DURATION_HISTOGRAM = "nvcf.helpers.duration"
+SIZE_HISTOGRAM = "nvcf.helpers.size"
+_CO_COROUTINE = 0x0080  # inspect.CO_COROUTINE, without importing inspect
+
+# set by enable_telemetry(), instrumented helpers only check this global when it
+# is None
+_telemetry = None
+_telemetry_lock = threading.Lock()
+
+
+class _NoopSpan:
+    """
+    Returned by span() while telemetry is disabled
+    """
+
+    __slots__ = ()
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+    def set_attribute(self, key: str, value):
+        pass
+
+    def add_bytes(self, n_bytes: int):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class _Telemetry:
+    def __init__(self, tracer, meter, request_id, metrics_request_id: bool):
+        self.tracer = tracer
+        self.request_id = request_id
+        self.metrics_request_id = metrics_request_id
+        self.duration = meter.create_histogram(
+            DURATION_HISTOGRAM,
+            unit="s",
+            description="Duration of the decode, encode, upload, compress "
+            "and progress helpers",
+        )
+        self.size = meter.create_histogram(
+            SIZE_HISTOGRAM,
+            unit="By",
+            description="Bytes decoded, encoded, uploaded or compressed "
+            "by the helpers",
+        )
+
+    def metric_attributes(self, operation: str, request_id: str) -> dict:
+        attributes = {OPERATION_ATTRIBUTE: operation}
+        if self.metrics_request_id and request_id:
+            attributes[REQUEST_ID_ATTRIBUTE] = request_id
+        return attributes
+
+    def record_upload(self, metrics: dict):
+        """
+        Upload metrics hook: adds the transfer to the current upload span and
+        the size histogram
+        """
+        from opentelemetry import trace
+
+        span = trace.get_current_span()
+        if span.is_recording():
+            span.set_attribute(BYTES_ATTRIBUTE, metrics["bytes"])
+            span.set_attribute(
+                "http.response.status_code", metrics["status_code"]
+            )
+            span.set_attribute("nvcf.upload.mb_per_s", metrics["mb_per_s"])
+        attributes = self.metric_attributes("upload", self.request_id())
+        attributes["http.response.status_code"] = metrics["status_code"]
+        self.size.record(metrics["bytes"], attributes)
+
+
+class _OperationSpan:
+    """
+    An OpenTelemetry span that also records the duration and size histograms
+    when it ends
+    """
+
+    __slots__ = (
+        "_telemetry",
+        "_operation",
+        "_request_id",
+        "_attributes",
+        "_span_cm",
+        "_span",
+        "_start",
+        "_n_bytes",
+    )
+
+    def __init__(
+        self,
+        telemetry: _Telemetry,
+        operation: str,
+        request_id: str,
+        attributes: dict,
+    ):
+        self._telemetry = telemetry
+        self._operation = operation
+        self._request_id = request_id
+        self._attributes = attributes
+        self._span_cm = None
+        self._span = None
+        self._start = None
+        self._n_bytes = None
+
+    def __enter__(self) -> "_OperationSpan":
+        attributes = {OPERATION_ATTRIBUTE: self._operation}
+        if self._request_id:
+            attributes[REQUEST_ID_ATTRIBUTE] = self._request_id
+        attributes.update(self._attributes)
+        self._span_cm = self._telemetry.tracer.start_as_current_span(
+            f"nvcf.{self._operation}", attributes=attributes
+        )
+        self._span = self._span_cm.__enter__()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        duration = time.perf_counter() - self._start
+        attributes = self._telemetry.metric_attributes(
+            self._operation, self._request_id
+        )
+        if exc_type is not None:
+            attributes["error.type"] = exc_type.__name__
+        self._telemetry.duration.record(duration, attributes)
+        if self._n_bytes is not None:
+            self._telemetry.size.record(self._n_bytes, attributes)
+        # records the exception and sets the error status
+        return self._span_cm.__exit__(exc_type, exc_val, exc_tb)
+
+    def set_attribute(self, key: str, value):
+        self._span.set_attribute(key, value)
+
+    def add_bytes(self, n_bytes: int):
+        """
+        Records the number of bytes processed, on the span and in the size
+        histogram
+        """
+        self._n_bytes = (self._n_bytes or 0) + n_bytes
+        self._span.set_attribute(BYTES_ATTRIBUTE, self._n_bytes)
+
+
+def _request_id_of(request_parameters) -> str:
+    from .helpers import RequestContext
+
+    return RequestContext.from_request(request_parameters).request_id
+
+
+def span(operation: str, request_parameters=None, **attributes):
+    """
+    Context manager tracing an operation as the span nvcf.<operation> and
+    recording its duration in the nvcf.helpers.duration histogram. A shared
+    no-op object is returned while telemetry is disabled.
+    The span is tagged with the NVCF request ID of request_parameters, or else
+    with the one set by set_log_request_id for the current request.
+    :param operation: name of the operation, e.g. "postprocess"
+    :param request_parameters: optional dict of the parameters passed to the
+        function or a RequestContext
+    :param attributes: extra span attributes
+    :return: a context manager whose value has set_attribute(key, value) and
+        add_bytes(n_bytes)
+
+    Example Usage:
+        with span("inference", request_parameters, model="sdxl") as s:
+            output = model(inputs)
+            s.add_bytes(output.nbytes)
+    """
+    telemetry = _telemetry
+    if telemetry is None:
+        return _NOOP_SPAN
+    if request_parameters is not None:
+        request_id = _request_id_of(request_parameters)
+    else:
+        request_id = telemetry.request_id()
+    return _OperationSpan(telemetry, operation, request_id, attributes)
+
+
+def instrument(operation: str, size=None):
+    """
+    Decorator tracing every call of a function or coroutine function with
+    span(operation).
+    While telemetry is disabled the function is called directly.
+    :param operation: name of the operation
+    :param size: optional function (args, kwargs, result) -> number of bytes
+        processed by the call
+
+    Example Usage:
+        @instrument(
+            "preprocess", size=lambda args, kwargs, result: result.nbytes
+        )
+        def preprocess(image):
+            ...
+    """
+
+    def decorate(func):
+        if func.__code__.co_flags & _CO_COROUTINE:
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if _telemetry is None:
+                    return await func(*args, **kwargs)
+                with span(operation) as s:
+                    result = await func(*args, **kwargs)
+                    if size is not None:
+                        s.add_bytes(size(args, kwargs, result))
+                    return result
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _telemetry is None:
+                return func(*args, **kwargs)
+            with span(operation) as s:
+                result = func(*args, **kwargs)
+                if size is not None:
+                    s.add_bytes(size(args, kwargs, result))
+                return result
+
+        return wrapper
+
+    return decorate
+
+
+def enable_telemetry(
+    tracer_provider=None, meter_provider=None, metrics_request_id: bool = False
+):
+    """
+    Turns on the OpenTelemetry instrumentation of the helpers: image decoding
+    and encoding, uploads, gzip compression and progress writes are traced as
+    nvcf.<operation> spans and recorded in the nvcf.helpers.duration and
+    nvcf.helpers.size histograms. Requires opentelemetry-api
+    (nv_cloud_function_helpers[telemetry]), the spans and metrics go to the
+    globally configured providers unless others are given.
+    :param tracer_provider: optional opentelemetry TracerProvider
+    :param meter_provider: optional opentelemetry MeterProvider
+    :param metrics_request_id: also tag the histograms with the request ID,
+        which makes their cardinality grow with the number of requests. Spans
+        are always tagged.
+
+    Example Usage:
+        tracer_provider = TracerProvider(resource=resource)
+        tracer_provider.add_span_processor(
+            BatchSpanProcessor(OTLPSpanExporter())
+        )
+        enable_telemetry(tracer_provider=tracer_provider)
+    """
+    global _telemetry
+
+    from opentelemetry import trace, metrics  # optional dependency
+    from .helpers import (
+        _log_request_id,
+        add_upload_metrics_hook,
+        remove_upload_metrics_hook,
+    )
+
+    telemetry = _Telemetry(
+        trace.get_tracer(TELEMETRY_SCOPE, tracer_provider=tracer_provider),
+        metrics.get_meter(TELEMETRY_SCOPE, meter_provider=meter_provider),
+        _log_request_id.get,
+        metrics_request_id,
+    )
+    with _telemetry_lock:
+        if _telemetry is not None:
+            remove_upload_metrics_hook(_telemetry.record_upload)
+        add_upload_metrics_hook(telemetry.record_upload)
+        _telemetry = telemetry
+
+
+def disable_telemetry():
+    """
+    Turns the instrumentation back into no-ops
+    """
+    global _telemetry
+
+    from .helpers import remove_upload_metrics_hook
+
+    with _telemetry_lock:
+        if _telemetry is not None:
+            remove_upload_metrics_hook(_telemetry.record_upload)
+        _telemetry = None
+
+
+def telemetry_enabled() -> bool:
+    return _telemetry is not None
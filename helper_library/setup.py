@@ -5,11 +5,15 @@ setup(
     version="0.0.1",
     description="A library with functions for NVCF",
     url="https://github.com/NVIDIA/nv-cloud-function-helpers",
-    packages=find_packages(),
+    packages=find_packages(exclude=["benchmarks", "benchmarks.*"]),
     install_requires=[
         "Pillow>=10.0.0",
         "Requests>=2.31.0",
         "numpy>=1.17",
     ],
+    extras_require={
+        "async": ["httpx>=0.24.1"],
+        "telemetry": ["opentelemetry-api>=1.20.0"],
+    },
     dependency_links=["https://pypi.ngc.nvidia.com"],
 )